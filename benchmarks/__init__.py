@@ -0,0 +1 @@
+"""Benchmarks for the weight tracker's compute and storage hot paths"""
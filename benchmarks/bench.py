@@ -0,0 +1,197 @@
+"""Time the app's hot paths on synthetic histories and compare to a baseline.
+
+Run from the repository root:
+
+    python -m benchmarks.bench                      # 1k and 100k rows, daily and intraday
+    python -m benchmarks.bench --sizes 10m --freqs intraday --repeat 1
+    python -m benchmarks.bench --save-baseline      # accept the current numbers
+
+Results are written as JSON (``--output``). Each benchmark is keyed by
+backend, name, size and frequency, e.g. ``csv/load_data[100k-daily]``, and
+its median is compared with the same key in the baseline file; the exit
+status is 1 if any benchmark got slower than the tolerance allows.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_OUTPUT = ROOT / 'benchmarks' / 'results.json'
+DEFAULT_BASELINE = ROOT / 'benchmarks' / 'baseline.json'
+
+USER = 'bench_user'
+
+
+def benchmarks(history):
+    """(name, setup, run) for every benchmarked path, against one history"""
+    from weight_tracker import exports, importer, storage
+    from weight_tracker.core import calculate_streak, calculate_weekly_change
+    from weight_tracker.charts import downsample
+    from weight_tracker.derived import AVERAGE_WINDOWS
+
+    saved = lambda: storage.save_data(history, USER)
+
+    def analytics():
+        # The Analytics page with "Last 3 Months" selected
+        range_start = pd.Timestamp((datetime.now() - timedelta(days=90)).date())
+        filtered = storage.load_data(USER, since=range_start, columns=['date', 'weight']).sort_values('date')
+        averages = storage.load_moving_averages(USER, storage.load_data(USER))
+        averages = averages.iloc[len(averages) - len(filtered):]
+        for window in AVERAGE_WINDOWS:
+            if len(filtered) >= window:
+                filtered[f'{window}_day_avg'] = averages[f'avg_{window}'].to_numpy()
+        downsample(filtered, 'weight')
+
+    # Import into every other row of the history an upload that repeats half
+    # of those rows (duplicates to drop) and brings the other half (new rows)
+    existing = history.iloc[::2].reset_index(drop=True)
+    incoming = history.iloc[len(history) // 2:]
+    upload = {}
+
+    def import_setup():
+        storage.save_data(existing, USER)
+        upload['source'] = synthetic.upload(incoming)
+
+    cases = [
+        ('load_data', lambda: (saved(), storage._cache.clear()), lambda: storage.load_data(USER)),
+        ('load_data_cached', lambda: (saved(), storage.load_data(USER)), lambda: storage.load_data(USER)),
+        ('save_data', lambda: None, saved),
+        ('calculate_weekly_change', lambda: None, lambda: calculate_weekly_change(history['date'], history['weight'])),
+        ('calculate_streak', lambda: None, lambda: calculate_streak(history['date'])),
+        ('analytics', lambda: (saved(), storage.load_data(USER)), analytics),
+        ('import_csv', import_setup, lambda: importer.import_csv(upload['source'], USER, 'maintenance')),
+    ]
+    for fmt, export in exports.EXPORTERS.items():
+        cases.append((f'export_{fmt}', lambda: None, lambda export=export: export(history)))
+    return cases
+
+
+def time_case(setup, run, repeat):
+    """Median and best wall time of run() over repeat calls, setup() untimed"""
+    timings = []
+    for _ in range(repeat):
+        setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return {'median_s': statistics.median(timings), 'min_s': min(timings), 'repeat': repeat}
+
+
+def run_suite(sizes, freqs, repeat, only=None, log=print):
+    from weight_tracker import storage
+
+    results = {}
+    for size in sizes:
+        rows = synthetic.SIZES[size]
+        for freq in freqs:
+            if not synthetic.supported(rows, freq):
+                log(f"skip {size}-{freq}: dates out of range")
+                continue
+            history = synthetic.generate(rows, freq)
+            for name, setup, run in benchmarks(history):
+                if only and name not in only:
+                    continue
+                key = f"{storage.STORAGE_BACKEND}/{name}[{size}-{freq}]"
+                # Very large histories are timed once; they take seconds per call
+                results[key] = dict(time_case(setup, run, 1 if rows >= 1_000_000 else repeat), rows=rows)
+                log(f"{key:<50} {results[key]['median_s'] * 1000:10.2f} ms")
+            storage.delete_user_data(USER)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print each result against the baseline; returns the regressed keys"""
+    regressions = []
+    print(f"\n{'benchmark':<50} {'median':>10} {'baseline':>10} {'ratio':>7}")
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key:<50} {result['median_s'] * 1000:8.2f}ms {'-':>10} {'new':>7}")
+            continue
+        ratio = result['median_s'] / base['median_s'] if base['median_s'] else float('inf')
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+            flag = '  REGRESSION'
+        print(f"{key:<50} {result['median_s'] * 1000:8.2f}ms {base['median_s'] * 1000:8.2f}ms {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def _load_results(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)['results']
+    except FileNotFoundError:
+        return {}
+
+
+def _write_results(path, results):
+    payload = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1k,100k', help=f"comma-separated, from {', '.join(synthetic.SIZES)}")
+    parser.add_argument('--freqs', default='daily,intraday', help=f"comma-separated, from {', '.join(synthetic.FREQUENCIES)}")
+    parser.add_argument('--backend', default=os.environ.get('WEIGHT_TRACKER_STORAGE', 'csv'), choices=['csv', 'parquet', 'binary', 'sqlite'])
+    parser.add_argument('--only', help="comma-separated benchmark names to run")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument('--save-baseline', action='store_true', help="merge these results into the baseline file")
+    args = parser.parse_args(argv)
+
+    output = args.output.resolve()
+    baseline_path = args.baseline.resolve()
+    with tempfile.TemporaryDirectory(prefix='weight_bench_') as work_dir:
+        # Storage reads its configuration and writes relative to the working
+        # directory at import time, so both are set before importing it
+        os.environ['WEIGHT_TRACKER_STORAGE'] = args.backend
+        os.environ['WEIGHT_TRACKER_DB'] = os.path.join(work_dir, 'bench.db')
+        os.chdir(work_dir)
+        results = run_suite(
+            args.sizes.split(','), args.freqs.split(','), args.repeat,
+            only=set(args.only.split(',')) if args.only else None,
+        )
+
+    _write_results(output, results)
+    print(f"\nWrote {output}")
+    if args.save_baseline:
+        _write_results(baseline_path, {**_load_results(baseline_path), **results})
+        print(f"Updated {baseline_path}")
+        return 0
+
+    regressions = compare(results, _load_results(baseline_path), args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""Synthetic weight histories for benchmarking.
+
+Histories end yesterday and walk backwards, so date-relative code paths
+(streaks, "last 3 months") see realistic data. ``daily`` has one entry per
+day; ``intraday`` has a reading every ten minutes, like a smart scale
+syncing all day. pandas timestamps only span about 584 years, so 10M rows
+only exist as an intraday history.
+"""
+import io
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SIZES = {'1k': 1_000, '100k': 100_000, '10m': 10_000_000}
+
+FREQUENCIES = {'daily': '1D', 'intraday': '10min'}
+
+# Just after the earliest timestamp pandas can represent (1677-09-21)
+EARLIEST = datetime(1677, 9, 22)
+
+NOTES = np.array(['', '', '', 'Morning weigh-in', 'After workout', 'Feeling good'], dtype=object)
+
+
+def supported(rows, freq):
+    """Whether a history of this many rows fits the timestamp range"""
+    span_days = rows * pd.Timedelta(FREQUENCIES[freq]).total_seconds() / 86400
+    return span_days < (datetime.now() - EARLIEST).days
+
+
+def generate(rows, freq='daily', seed=0):
+    """A date-sorted history of rows entries in the storage column layout"""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp.now().normalize() - pd.Timedelta(days=1)
+    dates = pd.date_range(end=end, periods=rows, freq=FREQUENCIES[freq])
+    # A slow random walk around 80 kg, kept inside the accepted range
+    weights = np.clip(80 + np.cumsum(rng.normal(0, 0.05, rows)), 40, 200).round(1)
+    return pd.DataFrame({
+        'date': dates,
+        'weight': weights,
+        'notes': NOTES[rng.integers(0, len(NOTES), rows)],
+        'goal': 'maintenance',
+    })
+
+
+def upload(df):
+    """df as an uploaded CSV file (what st.file_uploader hands the importer)"""
+    source = io.BytesIO(df.drop(columns='goal').to_csv(index=False).encode())
+    source.size = len(source.getvalue())
+    return source
@@ -1,14 +1,27 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 import numpy as np
 from datetime import datetime, timedelta
-import json
-import os
-from pathlib import Path
 import io
 import hashlib
+from functools import partial
+
+from weight_tracker.storage import (
+    load_data, load_series, save_data, append_entry, delete_user_data, load_moving_averages,
+    date_index, trend_window, history_summary, load_user_profile, save_user_profile
+)
+from weight_tracker.core import (
+    calculate_bmi, get_bmi_category, calculate_weekly_change, get_motivational_message
+)
+from weight_tracker.dashboard import dashboard_metrics
+from weight_tracker.derived import AVERAGE_WINDOWS, TREND_COLUMN
+from weight_tracker.charts import downsample, render_mode, scatter_class
+from weight_tracker.exports import export_data
+from weight_tracker.importer import import_csv, read_preview
+from weight_tracker.validation import MIN_WEIGHT_KG, MAX_WEIGHT_KG, MAX_JUMP_KG, REJECTING_ISSUES
+from weight_tracker.users import get_user, add_user, put_user, has_users
+from weight_tracker.timing import Span, span, start_rerun, set_tags, finish_rerun
+from weight_tracker import profiling
 
 # Page configuration
 st.set_page_config(
@@ -18,158 +31,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Utility functions
-def calculate_bmi(weight_kg, height_cm):
-    """Calculate BMI from weight and height"""
-    if height_cm > 0:
-        height_m = height_cm / 100
-        return weight_kg / (height_m ** 2)
-    return 0
-
-def get_bmi_category(bmi):
-    """Get BMI category and color"""
-    if bmi < 18.5:
-        return "Underweight", "#ff6b6b"
-    elif bmi < 25:
-        return "Normal", "#51cf66"
-    elif bmi < 30:
-        return "Overweight", "#ffd43b"
-    else:
-        return "Obese", "#ff6b6b"
-
-def calculate_progress_to_goal(current_weight, target_weight, start_weight=None):
-    """Calculate progress toward goal as percentage"""
-    if start_weight is None or start_weight == target_weight:
-        return 0
-
-    total_change_needed = abs(target_weight - start_weight)
-    current_change = abs(current_weight - start_weight)
-
-    if total_change_needed == 0:
-        return 100
-
-    progress = (current_change / total_change_needed) * 100
-    return min(progress, 100)
-
-def calculate_streak(weight_data):
-    """Calculate days since last entry"""
-    if len(weight_data) == 0:
-        return 0
-
-    last_entry = weight_data['date'].max()
-    today = pd.Timestamp.now().normalize()
-    days_since = (today - last_entry.normalize()).days
-    return days_since
-
-def calculate_weekly_change(weight_data):
-    """Calculate weekly weight change rate"""
-    if len(weight_data) < 2:
-        return 0
-
-    # Get data from last 4 weeks
-    recent_data = weight_data.tail(28)  # Assuming roughly daily entries
-    if len(recent_data) < 2:
-        return 0
-
-    first_weight = recent_data.iloc[0]['weight']
-    last_weight = recent_data.iloc[-1]['weight']
-    days_diff = (recent_data.iloc[-1]['date'] - recent_data.iloc[0]['date']).days
-
-    if days_diff == 0:
-        return 0
-
-    weekly_change = ((last_weight - first_weight) / days_diff) * 7
-    return weekly_change
-
-def get_motivational_message(progress, goal, weekly_change):
-    """Get motivational message based on progress"""
-    messages = {
-        'weight_loss': {
-            'good': ["🔥 Amazing progress! Keep it up!", "💪 You're crushing your goals!", "⭐ Fantastic work this week!"],
-            'ok': ["👍 Steady progress! Stay consistent!", "💫 You're on the right track!", "🎯 Keep pushing forward!"],
-            'bad': ["💪 Every step counts! Don't give up!", "🌟 Tomorrow is a new day!", "🎯 Refocus and restart!"]
-        },
-        'weight_gain': {
-            'good': ["💪 Excellent gains! Keep eating!", "🔥 Building that muscle!", "⭐ Great progress this week!"],
-            'ok': ["👍 Steady gains! Stay consistent!", "💫 You're making progress!", "🎯 Keep up the good work!"],
-            'bad': ["💪 Consistency is key! You've got this!", "🌟 Small gains add up!", "🎯 Stay focused on your goals!"]
-        },
-        'maintenance': {
-            'good': ["⚖️ Perfect balance! Well maintained!", "✨ Consistency champion!", "🎯 Nailing your maintenance!"],
-            'ok': ["👍 Staying steady! Good job!", "💫 Maintaining well!", "⚖️ Balanced approach!"],
-            'bad': ["💪 Maintenance takes discipline too!", "🌟 Get back to your routine!", "🎯 You know what works!"]
-        }
-    }
-
-    # Determine performance level
-    if goal == 'weight_loss':
-        if weekly_change < -0.3:
-            level = 'good'
-        elif weekly_change < 0:
-            level = 'ok'
-        else:
-            level = 'bad'
-    elif goal == 'weight_gain':
-        if weekly_change > 0.3:
-            level = 'good'
-        elif weekly_change > 0:
-            level = 'ok'
-        else:
-            level = 'bad'
-    else:  # maintenance
-        if abs(weekly_change) < 0.2:
-            level = 'good'
-        elif abs(weekly_change) < 0.5:
-            level = 'ok'
-        else:
-            level = 'bad'
-
-    import random
-    goal_type = 'weight_loss' if goal == 'weight_loss' else 'weight_gain' if goal in ['weight_gain', 'reverse_goal'] else 'maintenance'
-    return random.choice(messages[goal_type][level])
-
-# Data storage functions
-def load_data(username):
-    """Load weight data from user-specific CSV file"""
-    csv_path = Path(f"weight_data_{username}.csv")
-    if csv_path.exists():
-        df = pd.read_csv(csv_path)
-        df['date'] = pd.to_datetime(df['date'])
-        return df
-    else:
-        # Return empty DataFrame for new users
-        return pd.DataFrame(columns=['date', 'weight', 'notes', 'goal'])
-
-def save_data(df, username):
-    """Save weight data to user-specific CSV file"""
-    csv_path = Path(f"weight_data_{username}.csv")
-    df.to_csv(csv_path, index=False)
-
-def load_user_profile(username):
-    """Load user profile from user-specific JSON file"""
-    json_path = Path(f"user_profile_{username}.json")
-    if json_path.exists():
-        with open(json_path, 'r') as f:
-            return json.load(f)
-    else:
-        # Default profile for new users
-        default_profile = {
-            'name': username.title(),
-            'goal': 'maintenance',
-            'target_weight': 85.0,
-            'current_weight': 85.0,
-            'height': 175.0  # cm
-        }
-        with open(json_path, 'w') as f:
-            json.dump(default_profile, f)
-        return default_profile
-
-def save_user_profile(profile, username):
-    """Save user profile to user-specific JSON file"""
-    json_path = Path(f"user_profile_{username}.json")
-    with open(json_path, 'w') as f:
-        json.dump(profile, f)
-
 # Authentication functions
 def hash_password(password):
     """Hash password for security"""
@@ -177,48 +38,27 @@ def hash_password(password):
 
 def check_credentials(username, password):
     """Check if username and password are correct"""
-    users = load_users()
+    user = get_user(username)
     
-    if username in users:
-        return users[username]['password'] == hash_password(password)
+    if user is not None:
+        return user['password'] == hash_password(password)
     return False
 
-def load_users():
-    """Load users from file or return empty dict if no users exist"""
-    users_file = Path("users.json")
-    if users_file.exists():
-        try:
-            with open(users_file, 'r') as f:
-                return json.load(f)
-        except:
-            pass
-    
-    # Return empty dict - no default users
-    return {}
-
-def save_users(users):
-    """Save users to file"""
-    with open("users.json", 'w') as f:
-        json.dump(users, f, indent=2)
-
 def create_user(username, password, security_question, security_answer):
     """Create a new user account"""
-    users = load_users()
-    
-    if username in users:
+    if get_user(username) is not None:
         return False, "Username already exists"
     
     if len(password) < 8:
         return False, "Password must be at least 8 characters"
     
-    # Create new user
-    users[username] = {
+    # Create new user (re-checked atomically in case another session just took the name)
+    if not add_user(username, {
         'password': hash_password(password),
         'security_question': security_question,
         'security_answer': security_answer
-    }
-    
-    save_users(users)
+    }):
+        return False, "Username already exists"
     
     # Create user profile and data files
     user_profile = {
@@ -238,25 +78,25 @@ def create_user(username, password, security_question, security_answer):
 
 def change_user_password(username, new_password):
     """Change user password"""
-    users = load_users()
-    if username in users:
-        users[username]['password'] = hash_password(new_password)
-        save_users(users)
+    user = get_user(username)
+    if user is not None:
+        user['password'] = hash_password(new_password)
+        put_user(username, user)
         return True
     return False
 
 def get_security_question(username):
     """Get security question for password reset"""
-    users = load_users()
-    if username in users:
-        return users[username]['security_question']
+    user = get_user(username)
+    if user is not None:
+        return user['security_question']
     return None
 
 def check_security_answer(username, answer):
     """Check if security answer is correct"""
-    users = load_users()
-    if username in users:
-        return users[username]['security_answer'].lower() == answer.lower()
+    user = get_user(username)
+    if user is not None:
+        return user['security_answer'].lower() == answer.lower()
     return False
 
 # Initialize authentication
@@ -427,7 +267,7 @@ if not st.session_state.authenticated:
             st.info("💡 **Personal Use Mode:** Skip login for quick access to your weight tracker")
 
             # No default users message
-            if not load_users():
+            if not has_users():
                 st.info("ℹ️ **Multi-User Setup:** Create your first account using the Sign Up button above for secure access!")
 
     st.stop()  # Stop execution here if not authenticated
@@ -435,9 +275,19 @@ if not st.session_state.authenticated:
 # If we get here, user is authenticated
 # Ensure username is set before loading data
 if st.session_state.username:
-    # Load user-specific data
-    weight_data = load_data(st.session_state.username)
-    user_profile = load_user_profile(st.session_state.username)
+    # Timing spans below are tagged with the page and history size
+    start_rerun(page=st.session_state.get('page', 'Dashboard'))
+    # Profile this rerun when asked to (env var or ?profile=<token>)
+    profiling.start(st.session_state.get('page', 'Dashboard'), st.session_state.username, st.query_params)
+    if 'profile' in st.query_params:
+        del st.query_params['profile']  # one rerun per request
+
+    # Load user-specific data (the summary; pages that need the rows load them)
+    with span('load_summary'):
+        summary = history_summary(st.session_state.username)
+        set_tags(history=summary.entries)
+    with span('load_user_profile'):
+        user_profile = load_user_profile(st.session_state.username)
     
     # Initialize session state
     if 'page' not in st.session_state:
@@ -513,22 +363,19 @@ if st.session_state.username:
                 st.rerun()
 
         # Key metrics
-        if len(weight_data) > 0:
-            # Calculate enhanced metrics
-            current_weight = weight_data.iloc[-1]['weight'] if len(weight_data) > 0 else user_profile['current_weight']
-            height = user_profile.get('height', 175.0)
-            bmi = calculate_bmi(current_weight, height)
-            bmi_category, bmi_color = get_bmi_category(bmi)
-            days_since_last = calculate_streak(weight_data)
-            weekly_change = calculate_weekly_change(weight_data)
-
-            # Progress to goal
-            start_weight = weight_data.iloc[0]['weight'] if len(weight_data) > 0 else current_weight
-            progress = calculate_progress_to_goal(current_weight, user_profile['target_weight'], start_weight)
+        metrics_span = Span('dashboard_metrics').start()
+        if summary.entries > 0:
+            # Enhanced metrics (the bundle the batch job exports), cached until
+            # the data or profile changes
+            metrics = dashboard_metrics(st.session_state.username, user_profile)
+            bmi, bmi_category, bmi_color = metrics['bmi'], metrics['bmi_category'], metrics['bmi_color']
+            days_since_last = metrics['days_since_entry']
+            weekly_change = metrics['weekly_change']
+            progress = metrics['progress']
 
             # Motivational message
             motivation = get_motivational_message(progress, user_profile['goal'], weekly_change)
-            last_entry_date = weight_data.iloc[-1]['date'].strftime('%B %d, %Y') if len(weight_data) > 0 else "No entries yet"
+            last_entry_date = metrics['last_entry'].strftime('%B %d, %Y')
 
             st.markdown(f"""
             <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -549,7 +396,7 @@ if st.session_state.username:
             with col1:
                 st.markdown(f"""
                 <div class="metric-card">
-                    <p class="metric-value">{len(weight_data)}</p>
+                    <p class="metric-value">{metrics['entries']}</p>
                     <p class="metric-label">Total Entries</p>
                 </div>
                 """, unsafe_allow_html=True)
@@ -591,7 +438,7 @@ if st.session_state.username:
                 """, unsafe_allow_html=True)
 
             with col6:
-                weight_range = weight_data['weight'].max() - weight_data['weight'].min()
+                weight_range = metrics['weight_range']
                 st.markdown(f"""
                 <div class="metric-card">
                     <p class="metric-value">{weight_range:.1f}</p>
@@ -618,43 +465,49 @@ if st.session_state.username:
                 if st.button("📁 Import CSV", use_container_width=True, type="secondary"):
                     st.session_state.page = 'Add Weight'
                     st.rerun()
-        
+        metrics_span.stop()
+
         # Cleaner goal summary (only if user has data)
-        if len(weight_data) > 0:
-            current_weight = weight_data.iloc[-1]['weight']
+        if summary.entries > 0:
+            current_weight = metrics['current_weight']
             goal_name = user_profile['goal'].replace('_', ' ').title()
             st.markdown(f"""
             <div class="goal-card">
                 <h3 style="margin: 0 0 0.5rem 0; font-family: 'Inter', sans-serif; font-weight: 700;">🎯 {goal_name}</h3>
                 <p style="margin: 0; font-family: 'Inter', sans-serif; font-weight: 400; opacity: 0.9;">
-                    Current: {current_weight:.1f} kg → Target: {user_profile['target_weight']:.1f} kg
+                    Current: {current_weight:.1f} kg · Trend: {metrics['trend_weight']:.1f} kg → Target: {user_profile['target_weight']:.1f} kg
                 </p>
             </div>
             """, unsafe_allow_html=True)
         
         # Weight trend chart and recent entries (only if data exists)
-        if len(weight_data) > 0:
-            # Weight trend chart
+        if summary.entries > 0:
+            # Weight trend chart (the summary keeps a downsampled series)
             st.markdown("### Weight Trend")
-            fig = px.line(
-                weight_data, 
-                x='date', 
-                y='weight',
-                title="",
-                labels={'date': 'Date', 'weight': 'Weight (kg)'}
-            )
-            fig.update_layout(
-                plot_bgcolor='rgba(0,0,0,0)',
-                paper_bgcolor='rgba(0,0,0,0)',
-                font=dict(family='Inter', size=12),
-                height=400
-            )
-            fig.update_traces(line=dict(color='#38b2ac', width=3))
-            st.plotly_chart(fig, use_container_width=True)
+            with span('weight_trend_chart'):
+                trend_data = summary.chart_frame()
+                # plotly is imported where a chart is built, so pages without charts never load it
+                import plotly.express as px
+                fig = px.line(
+                    trend_data, 
+                    x='date', 
+                    y='weight',
+                    title="",
+                    labels={'date': 'Date', 'weight': 'Weight (kg)'},
+                    render_mode=render_mode(len(trend_data))
+                )
+                fig.update_layout(
+                    plot_bgcolor='rgba(0,0,0,0)',
+                    paper_bgcolor='rgba(0,0,0,0)',
+                    font=dict(family='Inter', size=12),
+                    height=400
+                )
+                fig.update_traces(line=dict(color='#38b2ac', width=3))
+                st.plotly_chart(fig, use_container_width=True)
             
             # Recent entries
             st.markdown("### Recent Entries")
-            recent_data = weight_data.tail(5).sort_values('date', ascending=False)
+            recent_data = summary.recent_frame()
             st.dataframe(
                 recent_data[['date', 'weight', 'notes']].rename(
                     columns={'date': 'Date', 'weight': 'Weight (kg)', 'notes': 'Notes'}
@@ -674,10 +527,15 @@ if st.session_state.username:
         </div>
         """, unsafe_allow_html=True)
         
+        # Entry days and the last weigh-in, without scanning the history
+        entry_days = date_index(st.session_state.username)
+        if datetime.now().date() in entry_days:
+            st.info("✅ You've already logged your weight today.")
+
         with st.form("add_weight_form"):
             col1, col2 = st.columns(2)
             with col1:
-                weight = st.number_input("Weight (kg)", min_value=30.0, max_value=300.0, value=float(user_profile['current_weight']), step=0.1)
+                weight = st.number_input("Weight (kg)", min_value=MIN_WEIGHT_KG, max_value=MAX_WEIGHT_KG, value=float(user_profile['current_weight']), step=0.1)
             with col2:
                 date = st.date_input("Date", value=datetime.now().date(), max_value=datetime.now().date())
 
@@ -699,10 +557,9 @@ if st.session_state.username:
                 validation_errors = []
 
                 # Check for reasonable weight changes
-                if len(weight_data) > 0:
-                    last_weight = weight_data.iloc[-1]['weight']
-                    weight_diff = abs(weight - last_weight)
-                    if weight_diff > 5.0:  # More than 5kg change
+                if entry_days.last_weight is not None:
+                    weight_diff = abs(weight - entry_days.last_weight)
+                    if weight_diff > MAX_JUMP_KG:
                         validation_errors.append(f"⚠️ Large weight change detected: {weight_diff:.1f}kg from last entry")
 
                 # Check for future dates
@@ -710,7 +567,7 @@ if st.session_state.username:
                     validation_errors.append("⚠️ Cannot add entries for future dates")
 
                 # Check for duplicate dates
-                if len(weight_data) > 0 and date in weight_data['date'].dt.date.values:
+                if date in entry_days:
                     validation_errors.append("⚠️ Entry for this date already exists")
 
                 if validation_errors:
@@ -718,16 +575,15 @@ if st.session_state.username:
                         st.error(error)
                     st.info("💡 If this is correct, please double-check your input")
                 else:
-                    new_entry = pd.DataFrame({
-                        'date': [date],
-                        'weight': [weight],
-                        'notes': [notes],
-                        'goal': [user_profile['goal']]
-                    })
+                    new_entry = {
+                        'date': date,
+                        'weight': weight,
+                        'notes': notes,
+                        'goal': user_profile['goal']
+                    }
 
-                    weight_data = pd.concat([weight_data, new_entry], ignore_index=True)
-                    weight_data = weight_data.sort_values('date')  # Keep sorted by date
-                    save_data(weight_data, st.session_state.username)
+                    # Appends one line; out-of-order dates are re-sorted in the background
+                    append_entry(new_entry, st.session_state.username)
 
                     # Update current weight in profile
                     user_profile['current_weight'] = weight
@@ -738,6 +594,22 @@ if st.session_state.username:
 
         # Bulk entry section
         st.markdown("### 📊 Bulk Data Entry")
+
+        # Outcome of the import that triggered this rerun, shown once
+        if 'import_summary' in st.session_state:
+            import_summary = st.session_state.pop('import_summary')
+            st.success(f"✅ Successfully imported {import_summary['imported']} entries!")
+            import_issues = import_summary['report']
+            if len(import_issues):
+                skipped = import_issues['issue'].isin(REJECTING_ISSUES)
+                issue_counts = import_issues.groupby('message', sort=False).size()
+                st.warning(
+                    f"⚠️ {import_issues['row'].nunique():,} rows were flagged "
+                    f"({import_issues.loc[skipped, 'row'].nunique():,} skipped):\n\n"
+                    + "\n".join(f"- {message}: {count:,}" for message, count in issue_counts.items())
+                )
+                st.dataframe(import_issues.head(1000), use_container_width=True, hide_index=True)
+
         with st.expander("📋 CSV Import"):
             st.info("💡 Upload a CSV file to import multiple weight entries at once.")
 
@@ -755,42 +627,36 @@ if st.session_state.username:
 
             if uploaded_file is not None:
                 try:
-                    # Read CSV
-                    import_data = pd.read_csv(uploaded_file)
+                    # Read just the first rows; the import itself streams the file in chunks
+                    import_preview = read_preview(uploaded_file)
 
                     # Validate columns
                     required_cols = ['date', 'weight']
-                    missing_cols = [col for col in required_cols if col not in import_data.columns]
+                    missing_cols = [col for col in required_cols if col not in import_preview.columns]
 
                     if missing_cols:
                         st.error(f"❌ Missing required columns: {', '.join(missing_cols)}")
                     else:
                         # Preview data
                         st.markdown("**Preview of data to import:**")
-                        st.dataframe(import_data.head(), use_container_width=True)
+                        st.dataframe(import_preview, use_container_width=True)
 
                         if st.button("✅ Import Data", use_container_width=True):
-                            # Process and import data
-                            import_data['date'] = pd.to_datetime(import_data['date'])
-
-                            # Add missing columns with defaults
-                            if 'notes' not in import_data.columns:
-                                import_data['notes'] = ''
-                            import_data['goal'] = user_profile['goal']
-
-                            # Combine with existing data
-                            combined_data = pd.concat([weight_data, import_data], ignore_index=True)
-                            combined_data = combined_data.drop_duplicates(subset=['date']).sort_values('date')
-
-                            # Save data
-                            save_data(combined_data, st.session_state.username)
+                            import_progress = st.progress(0.0, text="Starting import...")
+                            with span('csv_import'):
+                                import_result = import_csv(
+                                    uploaded_file,
+                                    st.session_state.username,
+                                    user_profile['goal'],
+                                    progress=lambda fraction, message: import_progress.progress(fraction, text=message)
+                                )
 
                             # Update profile with latest weight
-                            if len(combined_data) > 0:
-                                user_profile['current_weight'] = float(combined_data.iloc[-1]['weight'])
+                            if import_result['last_weight'] is not None:
+                                user_profile['current_weight'] = import_result['last_weight']
                                 save_user_profile(user_profile, st.session_state.username)
 
-                            st.success(f"✅ Successfully imported {len(import_data)} entries!")
+                            st.session_state.import_summary = import_result
                             st.rerun()
 
                 except Exception as e:
@@ -820,66 +686,79 @@ if st.session_state.username:
         </div>
         """, unsafe_allow_html=True)
         
-        if len(weight_data) > 0:
+        if summary.entries > 0:
+            # Nothing here shows notes: read dates and weights only
+            with span('load_data'):
+                dates, weights = load_series(st.session_state.username)
+                weight_data = pd.DataFrame({'date': dates, 'weight': weights})
+
             # Time range selector
             col1, col2 = st.columns([1, 3])
             with col1:
                 time_range = st.selectbox("Time Range", ["All Time", "Last 3 Months", "Last 6 Months", "Last Year"], key="time_range")
             
-            # Filter data based on time range
-            if time_range == "Last 3 Months":
-                filtered_data = weight_data[weight_data['date'] >= (datetime.now() - timedelta(days=90)).date()]
-            elif time_range == "Last 6 Months":
-                filtered_data = weight_data[weight_data['date'] >= (datetime.now() - timedelta(days=180)).date()]
-            elif time_range == "Last Year":
-                filtered_data = weight_data[weight_data['date'] >= (datetime.now() - timedelta(days=365)).date()]
+            # Filter data based on time range (a range query against storage)
+            range_days = {"Last 3 Months": 90, "Last 6 Months": 180, "Last Year": 365}
+            if time_range in range_days:
+                range_start = pd.Timestamp((datetime.now() - timedelta(days=range_days[time_range])).date())
+                filtered_data = load_data(st.session_state.username, since=range_start, columns=['date', 'weight'])
             else:
                 filtered_data = weight_data
             
             # Enhanced analytics
             st.markdown("### 📈 Advanced Weight Analysis")
 
-            # Calculate moving averages
-            filtered_data = filtered_data.sort_values('date')
-            if len(filtered_data) >= 7:
-                filtered_data['7_day_avg'] = filtered_data['weight'].rolling(window=7, min_periods=1).mean()
-            if len(filtered_data) >= 30:
-                filtered_data['30_day_avg'] = filtered_data['weight'].rolling(window=30, min_periods=1).mean()
+            # Moving averages are maintained with the stored data; the selected
+            # range is always the most recent part of the history
+            with span('analytics_averages'):
+                filtered_data = filtered_data.sort_values('date')
+                averages = load_moving_averages(st.session_state.username, weight_data)
+                averages = averages.iloc[len(averages) - len(filtered_data):]
+                for window in AVERAGE_WINDOWS:
+                    if len(filtered_data) >= window:
+                        filtered_data[f'{window}_day_avg'] = averages[f'avg_{window}'].to_numpy()
+                filtered_data['trend'] = averages[TREND_COLUMN].to_numpy()
 
             # Weight trend chart with moving averages
+            chart_span = Span('analytics_chart').start()
+            import plotly.graph_objects as go
             fig = go.Figure()
 
-            # Main weight line
-            fig.add_trace(go.Scatter(
-                x=filtered_data['date'],
-                y=filtered_data['weight'],
+            # Main weight line (downsampled to roughly one point per pixel)
+            chart_points = downsample(filtered_data, 'weight')
+            fig.add_trace(scatter_class(len(chart_points))(
+                x=chart_points['date'],
+                y=chart_points['weight'],
                 mode='lines+markers',
                 name='Actual Weight',
                 line=dict(color='#38b2ac', width=3),
                 marker=dict(size=6)
             ))
 
-            # 7-day moving average
-            if '7_day_avg' in filtered_data.columns:
-                fig.add_trace(go.Scatter(
-                    x=filtered_data['date'],
-                    y=filtered_data['7_day_avg'],
-                    mode='lines',
-                    name='7-Day Average',
-                    line=dict(color='#667eea', width=2, dash='dash'),
-                    opacity=0.8
-                ))
-
-            # 30-day moving average
-            if '30_day_avg' in filtered_data.columns:
-                fig.add_trace(go.Scatter(
-                    x=filtered_data['date'],
-                    y=filtered_data['30_day_avg'],
-                    mode='lines',
-                    name='30-Day Average',
-                    line=dict(color='#f093fb', width=2, dash='dot'),
-                    opacity=0.7
-                ))
+            # Moving averages (7-day and 30-day by default)
+            average_styles = {7: ('#667eea', 'dash', 0.8), 30: ('#f093fb', 'dot', 0.7)}
+            for window in AVERAGE_WINDOWS:
+                if f'{window}_day_avg' in filtered_data.columns:
+                    color, dash, opacity = average_styles.get(window, ('#a0aec0', 'dashdot', 0.7))
+                    average_points = downsample(filtered_data, f'{window}_day_avg')
+                    fig.add_trace(scatter_class(len(average_points))(
+                        x=average_points['date'],
+                        y=average_points[f'{window}_day_avg'],
+                        mode='lines',
+                        name=f'{window}-Day Average',
+                        line=dict(color=color, width=2, dash=dash),
+                        opacity=opacity
+                    ))
+
+            # Exponentially smoothed trend line
+            trend_points = downsample(filtered_data, 'trend')
+            fig.add_trace(scatter_class(len(trend_points))(
+                x=trend_points['date'],
+                y=trend_points['trend'],
+                mode='lines',
+                name='Trend',
+                line=dict(color='#2d3748', width=2)
+            ))
 
             # Goal line
             fig.add_hline(
@@ -907,6 +786,7 @@ if st.session_state.username:
             fig.update_yaxes(title_text="Weight (kg)")
 
             st.plotly_chart(fig, use_container_width=True)
+            chart_span.stop()
 
             # Statistics summary
             col1, col2, col3, col4 = st.columns(4)
@@ -914,7 +794,8 @@ if st.session_state.username:
                 total_change = filtered_data.iloc[-1]['weight'] - filtered_data.iloc[0]['weight'] if len(filtered_data) > 1 else 0
                 st.metric("Total Change", f"{total_change:+.1f} kg")
             with col2:
-                avg_weekly_change = calculate_weekly_change(filtered_data)
+                # Trend fitted over the whole selected range
+                avg_weekly_change = calculate_weekly_change(filtered_data['date'], filtered_data['weight'], window_days=None)
                 st.metric("Weekly Rate", f"{avg_weekly_change:+.2f} kg/week")
             with col3:
                 volatility = filtered_data['weight'].std() if len(filtered_data) > 1 else 0
@@ -926,11 +807,12 @@ if st.session_state.username:
             # Simple trend prediction
             if len(filtered_data) >= 7:
                 st.markdown("### 🔮 Trend Prediction")
+                prediction_span = Span('analytics_prediction').start()
 
-                # Calculate trend over last 4 weeks
-                recent_weeks = filtered_data.tail(28)
-                if len(recent_weeks) >= 7:
-                    weekly_rate = calculate_weekly_change(recent_weeks)
+                # Trend over the last weeks, kept up to date by storage
+                recent_trend = trend_window(st.session_state.username)
+                if len(recent_trend) >= 2:
+                    weekly_rate = recent_trend.weekly_rate()
 
                     # Predict 4 weeks ahead
                     current_weight = filtered_data.iloc[-1]['weight']
@@ -964,6 +846,7 @@ if st.session_state.username:
                             'target': [target] * 4
                         })
 
+                        import plotly.express as px
                         fig_pred = px.line(progress_data, x='weeks', y=['predicted', 'target'],
                                          title="12-Week Projection",
                                          labels={'weeks': 'Weeks Ahead', 'value': 'Weight (kg)'})
@@ -971,17 +854,17 @@ if st.session_state.username:
                         st.plotly_chart(fig_pred, use_container_width=True)
                 else:
                     st.info("📈 Add more data points for trend predictions")
+                prediction_span.stop()
             
-            # Enhanced Export Options
+            # Enhanced Export Options (payloads are generated only when clicked)
             st.markdown("### 📤 Export Data")
             col1, col2, col3 = st.columns(3)
 
             with col1:
                 # CSV Export
-                csv_data = weight_data.to_csv(index=False)
                 st.download_button(
                     label="📄 Download CSV",
-                    data=csv_data,
+                    data=partial(export_data, st.session_state.username, 'csv'),
                     file_name=f"weight_data_{st.session_state.username}_{datetime.now().strftime('%Y%m%d')}.csv",
                     mime="text/csv",
                     use_container_width=True
@@ -989,10 +872,9 @@ if st.session_state.username:
 
             with col2:
                 # JSON Export
-                json_data = weight_data.to_json(orient='records', date_format='iso')
                 st.download_button(
                     label="🗂️ Download JSON",
-                    data=json_data,
+                    data=partial(export_data, st.session_state.username, 'json'),
                     file_name=f"weight_data_{st.session_state.username}_{datetime.now().strftime('%Y%m%d')}.json",
                     mime="application/json",
                     use_container_width=True
@@ -1000,12 +882,9 @@ if st.session_state.username:
 
             with col3:
                 # Excel-compatible CSV Export
-                excel_data = weight_data.copy()
-                excel_data['date'] = excel_data['date'].dt.strftime('%Y-%m-%d')
-                excel_csv = excel_data.to_csv(index=False, sep=';')  # Excel likes semicolons
                 st.download_button(
                     label="📊 Download Excel CSV",
-                    data=excel_csv,
+                    data=partial(export_data, st.session_state.username, 'excel_csv'),
                     file_name=f"weight_data_excel_{st.session_state.username}_{datetime.now().strftime('%Y%m%d')}.csv",
                     mime="text/csv",
                     use_container_width=True
@@ -1049,8 +928,8 @@ if st.session_state.username:
                 )
 
                 # Show current BMI
-                if len(weight_data) > 0:
-                    current_weight = weight_data.iloc[-1]['weight']
+                if summary.entries > 0:
+                    current_weight = summary.last_weight
                     current_bmi = calculate_bmi(current_weight, height)
                     target_bmi = calculate_bmi(target_weight, height)
 
@@ -1090,21 +969,18 @@ if st.session_state.username:
             st.markdown("### Data Management")
             if st.button("🗑️ Clear All Data", use_container_width=True, type="secondary"):
                 if st.button("⚠️ Confirm Deletion", key="confirm_delete"):
-                    # Delete user-specific files
-                    try:
-                        os.remove(f"weight_data_{st.session_state.username}.csv")
-                        os.remove(f"user_profile_{st.session_state.username}.json")
+                    # Delete user-specific data
+                    if delete_user_data(st.session_state.username):
                         st.success("✅ All data cleared successfully!")
                         st.rerun()
-                    except FileNotFoundError:
+                    else:
                         st.info("ℹ️ No data files to delete")
             
             # CSV Export
-            if len(weight_data) > 0:
-                csv_data = weight_data.to_csv(index=False)
+            if summary.entries > 0:
                 st.download_button(
                     label="📥 Download CSV",
-                    data=csv_data,
+                    data=partial(export_data, st.session_state.username, 'csv'),
                     file_name=f"weight_data_{st.session_state.username}_{datetime.now().strftime('%Y%m%d')}.csv",
                     mime="text/csv",
                     use_container_width=True
@@ -1297,3 +1173,6 @@ st.markdown("""
     }
 </style>
 """, unsafe_allow_html=True)
+
+finish_rerun()
+profiling.finish()
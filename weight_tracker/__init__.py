@@ -0,0 +1 @@
+"""Support modules for the Weight Tracker Streamlit app"""
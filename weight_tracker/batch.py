@@ -0,0 +1,82 @@
+"""Dashboard metrics for every user, computed in parallel.
+
+Run from the app's data directory (with the same WEIGHT_TRACKER_*
+settings as the app):
+
+    python -m weight_tracker.batch metrics.csv --workers 8
+
+Users come from the account store. They are split into batches that a
+process pool works through independently: each worker loads its users'
+histories and profiles and computes ``core.dashboard_metrics``, and the
+parent writes each finished batch to the output file in one go. Users
+share nothing, so throughput grows with the number of workers until the
+disk is the bottleneck.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from weight_tracker import core, storage, users
+
+OUTPUT_COLUMNS = [
+    'username', 'entries', 'current_weight', 'start_weight', 'min_weight', 'max_weight',
+    'weight_range', 'trend_weight', 'bmi', 'bmi_category', 'progress', 'weekly_change', 'days_since_entry',
+    'goal', 'target_weight',
+]
+
+# Users per task handed to a worker; large enough to amortize the round trip
+BATCH_SIZE = 500
+
+
+def user_metrics(username, today=None):
+    """Dashboard metric bundle for one user"""
+    dates, weights = storage.load_series(username)
+    metrics = core.dashboard_metrics(dates, weights, storage.load_user_profile(username, create=False), today)
+    metrics['username'] = username
+    return metrics
+
+
+def _metrics_batch(usernames, today):
+    rows = [user_metrics(username, today) for username in usernames]
+    return pd.DataFrame(rows, columns=OUTPUT_COLUMNS)
+
+
+def _write_batch(frame, path, first):
+    if path.endswith('.jsonl'):
+        with open(path, 'w' if first else 'a') as f:
+            frame.to_json(f, orient='records', lines=True)
+    else:
+        frame.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+
+
+def run(output, workers=None, batch_size=BATCH_SIZE, progress=None):
+    """Compute metrics for every user into output (.csv or .jsonl); returns the user count"""
+    usernames = sorted(users.load_users())
+    batches = [usernames[i:i + batch_size] for i in range(0, len(usernames), batch_size)]
+    today = np.datetime64(pd.Timestamp.now().date(), 'D')  # one "today" for the whole run
+
+    done = 0
+    _write_batch(pd.DataFrame(columns=OUTPUT_COLUMNS), output, first=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map() keeps batch order, so the output is sorted by username
+        for frame in pool.map(_metrics_batch, batches, [today] * len(batches)):
+            _write_batch(frame, output, first=False)
+            done += len(frame)
+            if progress:
+                progress(done, len(usernames))
+    return len(usernames)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute Dashboard metrics for all users")
+    parser.add_argument("output", help="Output file (.csv, or .jsonl for JSON lines)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: one per CPU)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Users per worker task")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    count = run(args.output, args.workers, args.batch_size)
+    print(f"Wrote metrics for {count} users to {args.output} in {time.perf_counter() - start:.1f}s")
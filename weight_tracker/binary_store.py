@@ -0,0 +1,254 @@
+"""Memory-mapped fixed-width binary files for long per-user weight series.
+
+Selected with ``WEIGHT_TRACKER_STORAGE=binary``, for histories of hundreds
+of thousands of readings (smart-scale imports). Each user has two files:
+
+- ``weight_data_<user>.bin``: one 12-byte record per entry, an int64
+  timestamp (nanoseconds) and a float32 weight, in date order
+- ``weight_data_<user>.side.csv``: notes, goal and any imported columns,
+  one line per record, keyed by record number
+
+The series file is opened with ``numpy.memmap``, so dates and weights are
+views of the page cache: nothing is parsed or decoded, and readers that
+only need date and weight never touch the side file. Entries dated on or
+after the latest one are appended to the end of both files; anything else
+rewrites them (each atomically, the series first).
+
+Readers map the series before reading the side file. An append writes the
+side lines first, so readers never see more records than side lines; side
+lines past the series (an append in progress, or one cut short) are
+ignored, and of two lines for the same record the later one wins. A
+rewrite replaces the two files one after the other, so a reader can still
+get the series of one generation and the side file of another: the side
+file's first line names the series file it was written with (its inode),
+and a reader that gets a side file from another generation reads both
+again. Files are only ever appended to or replaced, never truncated, so a
+mapping stays valid while it's in use.
+"""
+import io
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+RECORD = np.dtype([('date', '<i8'), ('weight', '<f4')])
+
+SIDE_COLUMNS = ['notes', 'goal']
+
+# First read size when reading a side file backwards for a tail (doubles as needed)
+SIDE_BLOCK_BYTES = 8 * 1024
+
+# First line of a side file, followed by the id of its series file
+SERIES_TAG = '#series='
+
+# Reads of a series and side file pair that a rewrite can land between
+# before giving up (a rewrite replaces the two within microseconds)
+PAIR_READ_ATTEMPTS = 50
+
+
+def side_path(path):
+    """The side file next to a series file"""
+    path = Path(path)
+    return path.with_name(f"{path.stem}.side.csv")
+
+
+def stored_weights(weights):
+    """Weights as read back from a series file: float32, widened to float64.
+
+    Rounding drops the float32 representation noise (75.3 would otherwise
+    read back as 75.30000305), as for Parquet files.
+    """
+    return np.round(np.asarray(weights, dtype='float32').astype('float64'), 4)
+
+
+def _records(df):
+    records = np.empty(len(df), dtype=RECORD)
+    records['date'] = pd.to_datetime(df['date']).to_numpy().astype('datetime64[ns]').view('i8')
+    records['weight'] = df['weight'].to_numpy(dtype='float32')
+    return records
+
+
+def _side(df, first_row, columns=None):
+    """df's side columns keyed by record number (in columns' layout if given)"""
+    if columns is None:
+        columns = SIDE_COLUMNS + [name for name in df.columns if name not in ('date', 'weight', *SIDE_COLUMNS)]
+    side = df.reindex(columns=columns).reset_index(drop=True)
+    side.insert(0, 'row', np.arange(first_row, first_row + len(df)))
+    return side
+
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _series_id(f):
+    """Id of an open series file; kept when the file is renamed over the old one"""
+    return os.fstat(f.fileno()).st_ino
+
+
+def _read_tag(f):
+    """The series id on a side file's first line, leaving f at the header line
+    (None for side files written without one)"""
+    line = f.readline()
+    tag = SERIES_TAG.encode() if isinstance(line, bytes) else SERIES_TAG
+    if line.startswith(tag):
+        return int(line[len(tag):])
+    f.seek(0)
+    return None
+
+
+def write_frame(df, path):
+    """Write a date-sorted weight frame (atomically replacing the files)"""
+    write_chunks([df], path)
+
+
+def write_chunks(chunks, path):
+    """Write a stream of date-sorted weight frames as one series"""
+    path = Path(path)
+    side = side_path(path)
+    tmp_path, tmp_side = Path(f"{path}.tmp"), Path(f"{side}.tmp")
+    rows = 0
+    try:
+        with open(tmp_path, 'wb') as series, open(tmp_side, 'w', newline='') as notes:
+            notes.write(f"{SERIES_TAG}{_series_id(series)}\n")
+            columns = None
+            for chunk in chunks:
+                lines = _side(chunk, rows, columns)
+                lines.to_csv(notes, header=columns is None, index=False)
+                columns = list(lines.columns[1:])
+                series.write(_records(chunk).tobytes())
+                rows += len(chunk)
+            if columns is None:
+                _side(pd.DataFrame(columns=['date', 'weight']), 0).to_csv(notes, index=False)
+            _sync(series)
+            _sync(notes)
+        # A reader between the two gets a side file tagged for the other series and reads again
+        os.replace(tmp_path, path)
+        os.replace(tmp_side, side)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        tmp_side.unlink(missing_ok=True)
+        raise
+
+
+def append_frame(df, path):
+    """Append date-sorted entries, all dated on or after the file's latest entry"""
+    path = Path(path)
+    first_row = os.path.getsize(path) // RECORD.itemsize
+    side = side_path(path)
+    with open(side, 'r', newline='') as f:
+        _read_tag(f)
+        columns = f.readline().rstrip('\r\n').split(',')[1:]
+    with open(side, 'a', newline='') as f:
+        # One write call per file, so readers see whole lines and records
+        f.write(_side(df, first_row, columns).to_csv(header=False, index=False))
+        _sync(f)
+    with open(path, 'ab') as f:
+        f.write(_records(df).tobytes())
+        _sync(f)
+
+
+def _map_series(path):
+    """read_series, and the id of the file mapped"""
+    with open(path, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        records = stat.st_size // RECORD.itemsize
+        if records == 0:
+            return np.array([], dtype='datetime64[ns]'), np.array([], dtype='float32'), stat.st_ino
+        series = np.memmap(f, dtype=RECORD, mode='r', shape=(records,))
+    return series['date'].view('datetime64[ns]'), series['weight'], stat.st_ino
+
+
+def read_series(path):
+    """Dates (datetime64[ns]) and weights (float32) of a series file as read-only memory-mapped views"""
+    dates, weights, _ = _map_series(path)
+    return dates, weights
+
+
+def last_date(path):
+    """Date of a series file's latest entry, or None if it has none"""
+    dates, _ = read_series(path)
+    return dates[-1] if len(dates) else None
+
+
+def _read_side(path, records, start=0):
+    """Side columns of records start to records - 1 (empty where a line is missing),
+    and the id of the series file the side file was written with"""
+    with open(side_path(path), 'rb') as f:
+        series_id = _read_tag(f)
+        header_at = f.tell()
+        side = _read_side_tail(f, start) if start else None
+        if side is None:
+            f.seek(header_at)
+            side = pd.read_csv(f)
+    side = side[(side['row'] >= start) & (side['row'] < records)].drop_duplicates('row', keep='last')
+    return side.set_index('row').reindex(np.arange(start, records)).reset_index(drop=True), series_id
+
+
+def _read_side_tail(f, start):
+    """An open side file's lines from the one for record start on, read backwards
+    in growing blocks; None if a quoted value spans lines (read it all instead)"""
+    header = f.readline()
+    body_start = f.tell()
+    end = f.seek(0, os.SEEK_END)
+    block = SIDE_BLOCK_BYTES
+    while True:
+        begin = max(body_start, end - block)
+        f.seek(begin)
+        lines = f.read(end - begin).split(b'\n')
+        if begin > body_start:
+            lines = lines[1:]  # Starts mid-line (or the line is read again next round)
+        lines = [line for line in lines if line.strip()]
+        if any(line.count(b'"') % 2 for line in lines):
+            return None
+        side = pd.read_csv(io.BytesIO(header + b'\n'.join(lines)))
+        # Lines for a record follow any stale ones for it, so once a line
+        # at or before start is in, so is everything the tail needs
+        if begin == body_start or (side['row'] <= start).any():
+            return side
+        block *= 2
+
+
+def read_frame(path, columns=None, start=0):
+    """Read a weight frame from record start on, optionally projected to a subset of columns.
+
+    The date column is a view of the mapped file; weights are widened to
+    float64 (stored_weights). The side file is only read for its columns.
+    """
+    for attempt in range(PAIR_READ_ATTEMPTS):
+        dates, weights, mapped_id = _map_series(path)
+        df = pd.DataFrame({'date': dates[start:], 'weight': stored_weights(weights[start:])}, copy=False)
+        if columns is not None and all(name in ('date', 'weight') for name in columns):
+            return df[columns] if columns else df
+        side, series_id = _read_side(path, len(dates), start)
+        if series_id in (None, mapped_id):
+            df = pd.concat([df, side], axis=1)
+            return df[columns] if columns else df
+        time.sleep(0.001)  # A rewrite is between replacing the two files
+    raise OSError(f"{side_path(path)} was not written with {path}")
+
+
+def read_tail(path, rows=None, days=None, columns=None):
+    """The last rows entries of a file, or those within days of the latest one.
+
+    The range is found by binary search on the mapped dates and the side file
+    is read from its end, so the cost doesn't grow with the series' length.
+    """
+    dates, _ = read_series(path)
+    if rows is not None:
+        start = max(len(dates) - rows, 0)
+    elif len(dates):
+        start = int(np.searchsorted(dates, dates[-1] - np.timedelta64(int(days * 86400), 's')))
+    else:
+        start = 0
+    return read_frame(path, columns, start)
+
+
+def convert_csv(csv_path, path):
+    """Convert an existing weight CSV to a series and side file"""
+    df = pd.read_csv(csv_path)
+    df['date'] = pd.to_datetime(df['date'], format='ISO8601')
+    write_frame(df.sort_values('date', kind='stable', ignore_index=True), path)
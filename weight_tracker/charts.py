@@ -0,0 +1,63 @@
+"""Helpers that keep chart payloads bounded for long histories.
+
+Series are downsampled with Largest-Triangle-Three-Buckets (LTTB) to about
+one point per horizontal pixel before a figure is built, and traces switch
+to WebGL once they still carry many points.
+"""
+import os
+
+import numpy as np
+
+# Approximate plot width in pixels; charts never need more points than this
+CHART_WIDTH_PX = int(os.environ.get('WEIGHT_TRACKER_CHART_WIDTH_PX', '1200'))
+
+# Draw with WebGL (Scattergl) above this many points per trace
+WEBGL_THRESHOLD = int(os.environ.get('WEIGHT_TRACKER_WEBGL_THRESHOLD', '1000'))
+
+
+def lttb_indices(x, y, threshold):
+    """Indices of the points LTTB keeps when reducing (x, y) to threshold points"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        # Third vertex of the triangle: the average of the next bucket
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(df, y, x='date', max_points=CHART_WIDTH_PX):
+    """Rows of df that preserve the visual shape of df[y] over df[x]"""
+    if len(df) <= max_points:
+        return df
+    xs = df[x].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    return df.iloc[lttb_indices(xs, df[y].to_numpy(dtype=float), max_points)]
+
+
+def scatter_class(n_points):
+    """go.Scatter, or go.Scattergl for traces with many points"""
+    import plotly.graph_objects as go
+
+    return go.Scattergl if n_points > WEBGL_THRESHOLD else go.Scatter
+
+
+def render_mode(n_points):
+    """plotly.express render_mode matching scatter_class"""
+    return 'webgl' if n_points > WEBGL_THRESHOLD else 'svg'
@@ -0,0 +1,130 @@
+"""Parquet files for per-user weight histories.
+
+Selected with ``WEIGHT_TRACKER_STORAGE=parquet``. Columns are stored typed
+(timestamp dates, float32 weights, dictionary-encoded goals), so loading
+skips CSV text parsing and dtype inference, and readers can ask for just
+the columns they need. Requires ``pyarrow``, which is imported lazily so
+the default CSV storage doesn't depend on it.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError(
+            "WEIGHT_TRACKER_STORAGE=parquet requires pyarrow (pip install pyarrow)"
+        ) from e
+    return pa, pq
+
+
+def _to_table(df):
+    pa, _ = _pyarrow()
+    dates = pd.to_datetime(df['date']).to_numpy().astype('datetime64[ms]')
+    columns = {
+        'date': pa.array(dates, type=pa.timestamp('ms')),
+        'weight': pa.array(df['weight'].to_numpy(dtype='float32')),
+    }
+    for name in ('notes', 'goal'):
+        values = df[name] if name in df.columns else pd.Series(pd.NA, index=df.index)
+        columns[name] = pa.array(values.astype('string'), type=pa.string(), from_pandas=True)
+    columns['goal'] = columns['goal'].dictionary_encode()
+
+    # Keep any extra columns a CSV import brought along, with inferred types
+    for name in df.columns:
+        if name not in columns:
+            columns[name] = pa.array(df[name], from_pandas=True)
+    return pa.table(columns)
+
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def write_frame(df, path):
+    """Write a weight frame to a Parquet file (atomically replacing it)"""
+    write_chunks([df], path)
+
+
+def write_chunks(chunks, path):
+    """Write a stream of weight frames to one Parquet file, a row group per chunk"""
+    _, pq = _pyarrow()
+    tmp_path = Path(f"{path}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            writer = None
+            try:
+                for chunk in chunks:
+                    table = _to_table(chunk)
+                    if writer is None:
+                        writer = pq.ParquetWriter(f, table.schema, compression='zstd')
+                    writer.write_table(table.cast(writer.schema))
+                if writer is None:
+                    table = _to_table(pd.DataFrame(columns=['date', 'weight', 'notes', 'goal']))
+                    writer = pq.ParquetWriter(f, table.schema, compression='zstd')
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+            _sync(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def read_frame(path, columns=None):
+    """Read a weight frame, optionally projecting to a subset of columns"""
+    _, pq = _pyarrow()
+    # One open file throughout: by path, pyarrow may open it again and land on
+    # a newer file that a writer renamed into place in between
+    with open(path, 'rb') as f:
+        df = pq.read_table(f, columns=columns).to_pandas()
+    return _weights_as_float64(df)
+
+
+def _weights_as_float64(df):
+    if 'weight' in df.columns:
+        # float32 -> float64 for arithmetic; rounding drops the float32
+        # representation noise (75.3 would otherwise read back as 75.30000305)
+        df['weight'] = np.round(df['weight'].astype('float64'), 4)
+    return df
+
+
+def read_tail(path, rows=None, days=None, columns=None):
+    """Trailing row groups of a date-sorted file that hold its last rows entries,
+    or all entries within days of the latest one (the caller trims the rest).
+
+    Files written in chunks only decode their last few groups. days needs
+    the date column among columns.
+    """
+    _, pq = _pyarrow()
+    with open(path, 'rb') as f:
+        parquet = pq.ParquetFile(f)
+        groups = []
+        for group in reversed(range(parquet.num_row_groups)):
+            groups.insert(0, parquet.read_row_group(group, columns=columns).to_pandas())
+            if rows is not None and sum(len(g) for g in groups) >= rows:
+                break
+            dates = pd.concat([g['date'] for g in groups]) if days is not None else None
+            if dates is not None and len(dates) and dates.iat[0] < dates.iat[-1] - pd.Timedelta(days=days):
+                break
+    if not groups:
+        return read_frame(path, columns)
+    return _weights_as_float64(pd.concat(groups, ignore_index=True))
+
+
+def convert_csv(csv_path, parquet_path):
+    """Convert an existing weight CSV to Parquet and return the frame"""
+    df = pd.read_csv(csv_path)
+    df['date'] = pd.to_datetime(df['date'], format='ISO8601')
+    df = df.sort_values('date', kind='stable', ignore_index=True)
+    write_frame(df, parquet_path)
+    return read_frame(parquet_path)
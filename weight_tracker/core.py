@@ -0,0 +1,199 @@
+"""Dashboard computations, usable without Streamlit.
+
+Importing this module pulls in NumPy and the standard library only, so
+batch jobs and scripts can reuse the app's math without booting the UI,
+pandas or plotly. Functions take plain values or arrays: weights as
+numbers, dates as anything NumPy can view as ``datetime64`` (a pandas
+date column works as is), so they also run over many users at once.
+"""
+import random
+from datetime import datetime
+
+import numpy as np
+
+from weight_tracker import derived, trend
+
+BMI_CATEGORIES = [
+    # (upper bound, label, color)
+    (18.5, "Underweight", "#ff6b6b"),
+    (25, "Normal", "#51cf66"),
+    (30, "Overweight", "#ffd43b"),
+    (float('inf'), "Obese", "#ff6b6b"),
+]
+
+MOTIVATIONAL_MESSAGES = {
+    'weight_loss': {
+        'good': ["🔥 Amazing progress! Keep it up!", "💪 You're crushing your goals!", "⭐ Fantastic work this week!"],
+        'ok': ["👍 Steady progress! Stay consistent!", "💫 You're on the right track!", "🎯 Keep pushing forward!"],
+        'bad': ["💪 Every step counts! Don't give up!", "🌟 Tomorrow is a new day!", "🎯 Refocus and restart!"]
+    },
+    'weight_gain': {
+        'good': ["💪 Excellent gains! Keep eating!", "🔥 Building that muscle!", "⭐ Great progress this week!"],
+        'ok': ["👍 Steady gains! Stay consistent!", "💫 You're making progress!", "🎯 Keep up the good work!"],
+        'bad': ["💪 Consistency is key! You've got this!", "🌟 Small gains add up!", "🎯 Stay focused on your goals!"]
+    },
+    'maintenance': {
+        'good': ["⚖️ Perfect balance! Well maintained!", "✨ Consistency champion!", "🎯 Nailing your maintenance!"],
+        'ok': ["👍 Staying steady! Good job!", "💫 Maintaining well!", "⚖️ Balanced approach!"],
+        'bad': ["💪 Maintenance takes discipline too!", "🌟 Get back to your routine!", "🎯 You know what works!"]
+    }
+}
+
+
+def _scalar_or_array(values):
+    return values.item() if np.ndim(values) == 0 else values
+
+
+def _dates(values):
+    values = np.asarray(values)
+    return values if np.issubdtype(values.dtype, np.datetime64) else values.astype('datetime64[ns]')
+
+
+def calculate_bmi(weight_kg, height_cm):
+    """Calculate BMI from weight and height (0 where height isn't positive)"""
+    weight_kg = np.asarray(weight_kg, dtype=float)
+    height_m = np.asarray(height_cm, dtype=float) / 100
+    shape = np.broadcast(weight_kg, height_m).shape
+    bmi = np.divide(weight_kg, height_m ** 2, out=np.zeros(shape), where=height_m > 0)
+    return _scalar_or_array(bmi)
+
+
+def get_bmi_category(bmi):
+    """Get BMI category and color"""
+    for upper, label, color in BMI_CATEGORIES:
+        if bmi < upper:
+            return label, color
+    return BMI_CATEGORIES[-1][1:]
+
+
+def bmi_category_labels(bmi):
+    """BMI category label for each value of an array"""
+    bounds = [upper for upper, _, _ in BMI_CATEGORIES[:-1]]
+    labels = np.array([label for _, label, _ in BMI_CATEGORIES])
+    return labels[np.searchsorted(bounds, np.asarray(bmi, dtype=float), side='right')]
+
+
+def calculate_progress_to_goal(current_weight, target_weight, start_weight=None):
+    """Calculate progress toward goal as percentage (0-100)"""
+    if start_weight is None:
+        return 0
+    current_weight, target_weight, start_weight = (
+        np.asarray(w, dtype=float) for w in (current_weight, target_weight, start_weight)
+    )
+    total_change_needed = np.abs(target_weight - start_weight)
+    current_change = np.abs(current_weight - start_weight)
+    shape = np.broadcast(current_change, total_change_needed).shape
+    # No change needed (start already at target) counts as no progress
+    progress = np.divide(current_change, total_change_needed, out=np.zeros(shape), where=total_change_needed > 0) * 100
+    return _scalar_or_array(np.minimum(progress, 100))
+
+
+def calculate_streak(dates, today=None):
+    """Calculate whole days since the latest of dates (0 without entries)"""
+    dates = _dates(dates)
+    if len(dates) == 0:
+        return 0
+    today = np.datetime64(today or datetime.now().date(), 'D')
+    return int((today - dates.max().astype('datetime64[D]')) // np.timedelta64(1, 'D'))
+
+
+def calculate_weekly_change(dates, weights, window_days=trend.TREND_WINDOW_DAYS):
+    """Calculate weekly weight change rate from a date-sorted history.
+
+    The trend over the last window_days days (the whole history for None),
+    fitted with the configured trend method.
+    """
+    if len(dates) < 2:
+        return 0
+    return trend.weekly_rate(dates, weights, window_days)
+
+
+def performance_level(goal, weekly_change):
+    """'good', 'ok' or 'bad' for a weekly change under a goal"""
+    if goal == 'weight_loss':
+        if weekly_change < -0.3:
+            return 'good'
+        elif weekly_change < 0:
+            return 'ok'
+        return 'bad'
+    elif goal == 'weight_gain':
+        if weekly_change > 0.3:
+            return 'good'
+        elif weekly_change > 0:
+            return 'ok'
+        return 'bad'
+    else:  # maintenance
+        if abs(weekly_change) < 0.2:
+            return 'good'
+        elif abs(weekly_change) < 0.5:
+            return 'ok'
+        return 'bad'
+
+
+def get_motivational_message(progress, goal, weekly_change):
+    """Get motivational message based on progress"""
+    level = performance_level(goal, weekly_change)
+    goal_type = 'weight_loss' if goal == 'weight_loss' else 'weight_gain' if goal in ['weight_gain', 'reverse_goal'] else 'maintenance'
+    return random.choice(MOTIVATIONAL_MESSAGES[goal_type][level])
+
+
+def _trend_weight(dates, weights):
+    if len(weights) == 0:
+        return None
+    return float(derived.ewma_trend(dates, weights)[-1])
+
+
+def history_stats(dates, weights):
+    """Entry count, first and latest weight, weight range and latest date of a date-sorted history"""
+    weights = np.asarray(weights, dtype=float)
+    entries = len(weights)
+    return {
+        'entries': entries,
+        'start_weight': float(weights[0]) if entries else None,
+        'current_weight': float(weights[-1]) if entries else None,
+        'min_weight': float(weights.min()) if entries else None,
+        'max_weight': float(weights.max()) if entries else None,
+        'last_date': _dates(dates).max() if entries else None,
+    }
+
+
+def metrics_from_stats(stats, profile, today=None, weekly_change=0, trend_weight=None):
+    """dashboard_metrics from a history's history_stats (and its weekly change and trend)"""
+    entries = stats['entries']
+    current_weight = stats['current_weight'] if entries else float(profile['current_weight'])
+    start_weight = stats['start_weight'] if entries else current_weight
+    min_weight = stats['min_weight'] if entries else current_weight
+    max_weight = stats['max_weight'] if entries else current_weight
+    bmi = calculate_bmi(current_weight, profile.get('height', 175.0))
+    bmi_category, bmi_color = get_bmi_category(bmi)
+    return {
+        'entries': entries,
+        'current_weight': current_weight,
+        'start_weight': start_weight,
+        'min_weight': min_weight,
+        'max_weight': max_weight,
+        'weight_range': max_weight - min_weight,
+        'bmi': bmi,
+        'bmi_category': bmi_category,
+        'bmi_color': bmi_color,
+        'progress': calculate_progress_to_goal(current_weight, profile['target_weight'], start_weight),
+        'weekly_change': weekly_change,
+        'trend_weight': trend_weight,
+        'days_since_entry': calculate_streak([stats['last_date']] if entries else [], today),
+        'goal': profile['goal'],
+        'target_weight': float(profile['target_weight']),
+    }
+
+
+def dashboard_metrics(dates, weights, profile, today=None, weekly_change=None, trend_weight=None):
+    """The numbers the Dashboard shows for one user's date-sorted history.
+
+    profile supplies height, target weight and goal, and the current weight
+    for users without entries. weekly_change and trend_weight can be passed
+    in when they're already known (storage keeps both current per user).
+    """
+    return metrics_from_stats(
+        history_stats(dates, weights), profile, today,
+        weekly_change=calculate_weekly_change(dates, weights) if weekly_change is None else weekly_change,
+        trend_weight=_trend_weight(dates, weights) if trend_weight is None else trend_weight,
+    )
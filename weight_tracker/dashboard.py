@@ -0,0 +1,44 @@
+"""The Dashboard's metric bundle, computed once per data and profile version.
+
+Everything the Dashboard shows is a function of the user's history and
+profile, except the days since the last entry, which moves with the date.
+The bundle is built once from the user's ``HistorySummary`` (so without
+reading the history) and cached in the shared storage cache, keyed on the
+data version and the profile's contents, so reruns and other sessions
+reuse it until one of them changes; only days_since_entry is refreshed on
+each call.
+"""
+import numpy as np
+import pandas as pd
+
+from weight_tracker import core, storage
+
+# Approximate cache footprint of one bundle
+METRICS_NBYTES = 2048
+
+
+def _build(username, profile):
+    summary = storage.history_summary(username)
+    # The summary's trend is dropped by an out-of-order entry; storage recomputes it
+    trend_weight = summary.ewma.value if summary.ewma is not None else storage.latest_trend(username)
+    metrics = core.metrics_from_stats(
+        summary.stats(), profile,
+        weekly_change=summary.window.weekly_rate() if summary.entries >= 2 else 0,
+        trend_weight=trend_weight,
+    )
+    metrics['last_entry'] = pd.Timestamp(summary.last_date) if summary.entries else None
+    return metrics
+
+
+def dashboard_metrics(username, profile, today=None):
+    """core.dashboard_metrics for a user, plus last_entry (the latest entry's date)"""
+    # Versioned before building: a write meanwhile leaves an entry no later call asks for
+    version = (storage.data_version(username), tuple(sorted(profile.items())))
+    metrics = dict(storage.memoize(
+        ('dashboard', username), version,
+        lambda: _build(username, profile),
+        nbytes=lambda _: METRICS_NBYTES
+    ))
+    if metrics['last_entry'] is not None:
+        metrics['days_since_entry'] = core.calculate_streak(np.array([metrics['last_entry']], dtype='datetime64[ns]'), today)
+    return metrics
@@ -0,0 +1,64 @@
+"""Per-user index of the calendar days that have a weight entry.
+
+Holds the distinct entry days as a sorted ``datetime64[D]`` array plus the
+latest entry, so "is there an entry on this day?" is a binary search and
+"what was the last weigh-in?" a field read, neither touching the history
+frame. ``storage`` keeps one per user in its cache and updates it on every
+write path instead of rebuilding it.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _day(value):
+    return np.datetime64(pd.Timestamp(value), 'D')
+
+
+class DateIndex:
+    """Sorted distinct entry days and the latest (date, weight) of a history"""
+
+    def __init__(self, days=None, last_date=None, last_weight=None):
+        self.days = np.array([], dtype='datetime64[D]') if days is None else days
+        self.last_date = last_date
+        self.last_weight = last_weight
+
+    @classmethod
+    def from_frame(cls, df):
+        """Index a history frame with date and weight columns"""
+        return cls().extend(df['date'], df['weight'])
+
+    def extend(self, dates, weights, notes=None):
+        """Index with a batch of entries added (in any order; notes are ignored)"""
+        dates = np.asarray(pd.to_datetime(dates), dtype='datetime64[ns]')
+        if len(dates) == 0:
+            return self
+        days = dates.astype('datetime64[D]')
+        if len(days) > 1 and not (days[1:] >= days[:-1]).all():
+            days = np.sort(days)
+        # Distinct days of sorted input in one pass, then merge with ours
+        days = days[np.concatenate(([True], days[1:] != days[:-1]))]
+        if len(self.days) and days[0] <= self.days[-1]:
+            days = np.union1d(self.days, days)
+        elif len(self.days):
+            days = np.concatenate((self.days, days))
+
+        # Latest entry; on a tie the one added last wins, as after a stable sort
+        latest = len(dates) - 1 - int(np.argmax(dates[::-1]))
+        last_date, last_weight = self.last_date, self.last_weight
+        if last_date is None or dates[latest] >= np.datetime64(last_date, 'ns'):
+            last_date = pd.Timestamp(dates[latest])
+            last_weight = float(np.asarray(weights, dtype=float)[latest])
+        return DateIndex(days, last_date, last_weight)
+
+    def __contains__(self, day):
+        day = _day(day)
+        i = np.searchsorted(self.days, day)
+        return bool(i < len(self.days) and self.days[i] == day)
+
+    def __len__(self):
+        """Number of distinct days with an entry"""
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        return int(self.days.nbytes) + 64
@@ -0,0 +1,130 @@
+"""Series derived from a weight history (moving averages, smoothed trend).
+
+Pure NumPy helpers with no I/O; ``storage`` persists their output next to
+each user's data and uses these to recompute only what a write changed.
+"""
+import os
+
+import numpy as np
+
+# Moving-average windows, in entries, kept for every user
+AVERAGE_WINDOWS = tuple(
+    int(w) for w in os.environ.get('WEIGHT_TRACKER_AVG_WINDOWS', '7,30').split(',') if w.strip()
+)
+
+
+def first_divergence(old_dates, old_weights, new_dates, new_weights):
+    """Index of the first row where two histories differ.
+
+    Returns the length of the shorter history when one is a prefix of the
+    other (e.g. entries were only appended).
+    """
+    n = min(len(old_dates), len(new_dates))
+    changed = (old_dates[:n] != new_dates[:n]) | (old_weights[:n] != new_weights[:n])
+    hits = np.flatnonzero(changed)
+    return int(hits[0]) if len(hits) else n
+
+
+def rolling_means(weights, windows=AVERAGE_WINDOWS, start=0):
+    """Trailing means of weights for rows start..end, one array per window.
+
+    Matches ``Series.rolling(window=w, min_periods=1).mean()`` but only reads
+    the max(windows) - 1 rows before start, so an append or a late insert
+    costs time proportional to the rows that actually changed.
+    """
+    weights = np.asarray(weights, dtype=float)
+    n = len(weights)
+    lo = max(0, start - max(windows, default=1) + 1)
+    sums = np.concatenate(([0.0], np.cumsum(weights[lo:])))
+    rows = np.arange(start, n)
+    means = {}
+    for window in windows:
+        first = np.maximum(rows - window + 1, 0)
+        means[window] = (sums[rows + 1 - lo] - sums[first - lo]) / (rows + 1 - first)
+    return means
+
+
+# Smoothing of the exponentially weighted trend line, per day
+TREND_ALPHA = float(os.environ.get('WEIGHT_TRACKER_TREND_ALPHA', '0.1'))
+
+# Sidecar column holding the trend line (named by alpha, so changing it rebuilds)
+TREND_COLUMN = f'ewma_{TREND_ALPHA:g}'
+
+# Bounds on the log-decay handled per vectorized segment of ewma_trend;
+# exp() of twice this stays finite in float64
+_MAX_LOG_DECAY = 300.0
+
+
+def ewma_trend(dates, weights, alpha=TREND_ALPHA, previous=None):
+    """Exponentially smoothed trend of date-sorted weights ("Hacker's Diet").
+
+    Each entry moves the trend toward its weight by alpha per day elapsed
+    since the previous entry: trend += (1 - (1 - alpha) ** days) * (weight -
+    trend). A missed day therefore counts as much as a logged one, and
+    several entries on one day barely move it. previous is the (date,
+    trend) just before these entries; without it the trend starts at the
+    first weight.
+
+    The recurrence is evaluated in closed form with cumulative log-decays,
+    a few NumPy passes per segment of history (segments are split wherever
+    the decay would leave float range, i.e. every few years at most).
+    """
+    dates = np.asarray(dates).astype('datetime64[ns]')
+    weights = np.asarray(weights, dtype=float)
+    n = len(dates)
+    if n == 0:
+        return np.empty(0)
+    if previous is None:
+        prior_date, prior_trend = dates[0], weights[0]
+    else:
+        prior_date, prior_trend = np.datetime64(previous[0], 'ns'), float(previous[1])
+
+    gaps = np.diff(dates, prepend=prior_date) / np.timedelta64(1, 'D')
+    log_decay = np.maximum(np.maximum(gaps, 0) * np.log1p(-alpha), -_MAX_LOG_DECAY)
+    cumulative = np.cumsum(log_decay)
+    trend = np.empty(n)
+    # Segment boundaries: rows where the cumulative decay crosses a multiple of the bound
+    segment = np.floor(-cumulative / _MAX_LOG_DECAY)
+    starts = np.flatnonzero(np.concatenate(([True], segment[1:] != segment[:-1])))
+    for start, end in zip(starts, np.append(starts[1:], n)):
+        base = cumulative[start - 1] if start else 0.0
+        rel = cumulative[start:end] - base  # in [-2 * bound, 0]
+        gains = -np.expm1(log_decay[start:end])  # 1 - decay
+        trend[start:end] = np.exp(rel) * (prior_trend + np.cumsum(gains * weights[start:end] * np.exp(-rel)))
+        prior_trend = trend[end - 1]
+    return trend
+
+
+class EwmaTrend:
+    """Latest value of a history's ewma_trend, advanced in O(1) per append.
+
+    extend() returns None for entries older than the latest one; the trend
+    after them has to be recomputed from the history (``storage`` does that
+    from the insertion point in the moving-average sidecar).
+    """
+
+    def __init__(self, last_date=None, value=None, alpha=TREND_ALPHA):
+        self.last_date = last_date
+        self.value = value
+        self.alpha = alpha
+
+    @classmethod
+    def from_frame(cls, df):
+        dates = np.asarray(df['date']).astype('datetime64[ns]')
+        weights = df['weight'].to_numpy(dtype=float)
+        if len(dates) == 0:
+            return cls()
+        order = np.argsort(dates, kind='stable')
+        return cls(dates[order][-1], float(ewma_trend(dates[order], weights[order])[-1]))
+
+    def extend(self, dates, weights, notes=None):
+        dates = np.asarray(dates).astype('datetime64[ns]')
+        if len(dates) == 0:
+            return self
+        if (dates[1:] < dates[:-1]).any() or (self.last_date is not None and dates[0] < self.last_date):
+            return None
+        previous = None if self.last_date is None else (self.last_date, self.value)
+        trend = ewma_trend(dates, weights, self.alpha, previous)
+        return EwmaTrend(dates[-1], float(trend[-1]), self.alpha)
+
+    nbytes = 64
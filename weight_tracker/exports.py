@@ -0,0 +1,32 @@
+"""Download payloads for a user's weight data, built on demand.
+
+Serializing a long history three ways on every Analytics render is wasted
+work when nobody clicks a download button, so payloads are only produced
+when requested and are cached per data version; the Analytics and Profile
+pages share the same cached CSV.
+"""
+from weight_tracker import storage
+from weight_tracker.timing import span
+
+
+def _excel_csv(df):
+    excel_data = df.copy()
+    excel_data['date'] = excel_data['date'].dt.strftime('%Y-%m-%d')
+    return excel_data.to_csv(index=False, sep=';')  # Excel likes semicolons
+
+
+EXPORTERS = {
+    'csv': lambda df: df.to_csv(index=False),
+    'json': lambda df: df.to_json(orient='records', date_format='iso'),
+    'excel_csv': _excel_csv,
+}
+
+
+def export_data(username, fmt):
+    """Serialized weight data for username in one of EXPORTERS' formats"""
+    with span(f'export_{fmt}'):
+        return storage.memoize(
+            ('export', username, fmt),
+            storage.data_version(username),
+            lambda: EXPORTERS[fmt](storage.load_data(username))
+        )
@@ -0,0 +1,159 @@
+"""Streaming CSV import for bulk weight data.
+
+Exports from other apps and smart scales can hold millions of rows, so the
+upload is never read in one piece: it is parsed in chunks, each chunk is
+validated and sorted and spilled to a temporary run file, and the runs are
+then merged with the user's existing history chunk by chunk (an external
+merge sort) and streamed into storage. Working memory is bounded by the
+chunk size rather than by the size of the upload.
+"""
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from weight_tracker import storage, validation
+
+# Rows parsed per chunk of the uploaded file
+IMPORT_CHUNK_ROWS = int(os.environ.get('WEIGHT_TRACKER_IMPORT_CHUNK_ROWS', '100000'))
+
+REQUIRED_COLUMNS = ['date', 'weight']
+
+
+def read_preview(source, nrows=5):
+    """First rows of an upload, for the preview table and a column check"""
+    preview = pd.read_csv(source, nrows=nrows)
+    source.seek(0)
+    return preview
+
+
+def _clean_chunk(chunk, goal, first_row, today=None):
+    """Validate one chunk; returns (accepted rows sorted by date, flagged rows).
+
+    Accepted rows carry their 1-based position in the upload in a _row
+    column so later sequence checks can report against it.
+    """
+    rows = np.arange(first_row, first_row + len(chunk))
+    dates, weights, issues = validation.check_values(chunk['date'].to_numpy(), chunk['weight'].to_numpy(), today)
+    valid = ~np.logical_or.reduce(list(issues.values()))
+
+    chunk = chunk.assign(date=dates.to_numpy(), weight=weights.to_numpy())[valid]
+    if 'notes' not in chunk.columns:
+        chunk['notes'] = ''
+    chunk['goal'] = goal
+    chunk['_row'] = rows[valid]
+    chunk = chunk[storage.DATA_COLUMNS + ['_row']].sort_values('date', kind='stable')
+    return chunk, validation.flagged_rows(rows, issues)
+
+
+def _frame_chunks(df, rows):
+    for start in range(0, len(df), rows):
+        yield df.iloc[start:start + rows]
+
+
+def _run_chunks(path, rows):
+    for chunk in pd.read_csv(path, chunksize=rows):
+        chunk['date'] = pd.to_datetime(chunk['date'], format='ISO8601')
+        yield chunk
+
+
+def merge_sorted(sources):
+    """Merge date-sorted chunk iterators into date-sorted output chunks.
+
+    Sources are listed in priority order: when several hold the same date,
+    rows from earlier sources come first (and win deduplication). Only one
+    buffered chunk per source is held at a time.
+    """
+    # Empty chunks (all rows of a chunk rejected) have no date to bound by
+    sources = [(chunk for chunk in source if len(chunk)) for source in sources]
+    buffers = [next(source, None) for source in sources]
+    while True:
+        active = [i for i, buffer in enumerate(buffers) if buffer is not None]
+        if not active:
+            return
+        # Nothing later in any source can sort before the smallest chunk end
+        bound = min(buffers[i]['date'].iat[-1] for i in active)
+        parts = []
+        for i in active:
+            buffer = buffers[i]
+            cut = buffer['date'].searchsorted(bound, side='right')
+            if cut:
+                parts.append(buffer.iloc[:cut])
+            buffers[i] = buffer.iloc[cut:] if cut < len(buffer) else next(sources[i], None)
+        yield pd.concat(parts, ignore_index=True).sort_values('date', kind='stable')
+
+
+def import_csv(source, username, goal, progress=None):
+    """Stream an uploaded CSV into a user's history.
+
+    Every row goes through the rules in ``validation``: rows with an
+    unparseable date or weight, a weight out of range or a future date are
+    skipped; rows whose date is already in the history (or earlier in the
+    upload) are dropped, keeping the existing entry; large jumps from the
+    previous entry are imported but flagged. progress(fraction, message) is
+    called as work proceeds. Returns a dict of counts, the latest weight
+    and the per-row validation report.
+    """
+    report = progress or (lambda fraction, message: None)
+    total_bytes = getattr(source, 'size', None)
+    existing = storage.load_data(username)
+    stats = {'read': 0, 'rejected': 0, 'imported': 0, 'duplicates': 0, 'total': 0, 'last_weight': None}
+    flagged = []
+
+    with tempfile.TemporaryDirectory(prefix='weight_import_') as tmp_dir:
+        # Pass 1: validate, clean and sort each chunk into its own run file
+        runs = []
+        for chunk in pd.read_csv(source, chunksize=IMPORT_CHUNK_ROWS):
+            missing = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+            if missing:
+                raise ValueError(f"Missing required columns: {', '.join(missing)}")
+            clean, issues = _clean_chunk(chunk, goal, stats['read'] + 1)
+            stats['read'] += len(chunk)
+            stats['rejected'] += len(chunk) - len(clean)
+            flagged.append(issues)
+            if len(clean):
+                run_path = os.path.join(tmp_dir, f"run_{len(runs)}.csv")
+                clean.to_csv(run_path, index=False)
+                runs.append(run_path)
+            if total_bytes:
+                report(min(source.tell() / total_bytes, 1.0) * 0.5, f"Parsed {stats['read']:,} rows")
+
+        # Pass 2: merge existing history (row 0) and runs, drop duplicate
+        # dates, flag jumps and stream to storage
+        read_rows = max(1000, IMPORT_CHUNK_ROWS // (len(runs) + 1))
+        sources = [_frame_chunks(existing.assign(_row=0), read_rows)] + [_run_chunks(path, read_rows) for path in runs]
+        expected = len(existing) + stats['read'] - stats['rejected']
+        previous = None
+
+        def merged_chunks():
+            nonlocal previous
+            merged_rows = 0
+            for chunk in merge_sorted(sources):
+                merged_rows += len(chunk)
+                issues = validation.check_sequence(chunk['date'], chunk['weight'], previous)
+                from_upload = chunk['_row'].to_numpy() > 0
+                flagged.append(validation.flagged_rows(
+                    chunk['_row'].to_numpy()[from_upload],
+                    {name: mask[from_upload] for name, mask in issues.items()}
+                ))
+                chunk = chunk[~issues['duplicate_date']].drop(columns='_row')
+                if len(chunk):
+                    previous = (chunk['date'].iat[-1], float(chunk['weight'].iat[-1]))
+                    stats['last_weight'] = previous[1]
+                    stats['total'] += len(chunk)
+                    report(0.5 + 0.5 * merged_rows / max(expected, 1), f"Merged {merged_rows:,} rows")
+                    yield chunk
+
+        if runs:
+            columns = list(dict.fromkeys(storage.DATA_COLUMNS + list(existing.columns)))
+            storage.write_history(username, merged_chunks(), columns)
+        else:
+            # Nothing accepted: the history stays as it is
+            stats['total'] = len(existing)
+
+    stats['imported'] = stats['total'] - len(existing)
+    stats['duplicates'] = stats['read'] - stats['rejected'] - stats['imported']
+    stats['report'] = validation.build_report(flagged)
+    report(1.0, "Import complete")
+    return stats
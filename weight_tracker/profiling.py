@@ -0,0 +1,116 @@
+"""cProfile and tracemalloc capture of single reruns, for slow-page reports.
+
+A capture is taken when ``WEIGHT_TRACKER_PROFILE=1`` (every rerun) or when
+the page is opened with ``?profile=<token>`` and the token matches
+``WEIGHT_TRACKER_PROFILE_TOKEN`` (one rerun; the parameter is then
+dropped). Each capture writes two files to ``WEIGHT_TRACKER_PROFILE_DIR``,
+named by time, page and a hash of the username:
+
+- ``.prof``: pstats data (``python -m pstats``, snakeviz, ...)
+- ``.txt``: the slowest functions by cumulative time and the top allocation
+  sites of the rerun
+
+cProfile only sees the rerun's own thread, but tracemalloc traces the whole
+process, so allocations of concurrent sessions are included. With neither
+switch set, a rerun pays for one dictionary lookup.
+"""
+import cProfile
+import hashlib
+import io
+import os
+import pstats
+import threading
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+# '1' profiles every rerun
+PROFILE_ALL = os.environ.get('WEIGHT_TRACKER_PROFILE', '') == '1'
+
+# Value of the ?profile= query parameter that requests a capture ('' disables it)
+PROFILE_TOKEN = os.environ.get('WEIGHT_TRACKER_PROFILE_TOKEN', '')
+
+PROFILE_DIR = Path(os.environ.get('WEIGHT_TRACKER_PROFILE_DIR', 'profiles'))
+
+# Rows of each report section
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+# Frames kept per allocation (enough to reach the app's line through pandas or plotly)
+TRACEMALLOC_FRAMES = 10
+
+_local = threading.local()
+_tracing_lock = threading.Lock()
+_tracing_captures = 0
+
+
+def requested(query_params):
+    """Whether this rerun should be captured, given the page's query parameters"""
+    if PROFILE_ALL:
+        return True
+    return bool(PROFILE_TOKEN) and query_params.get('profile') == PROFILE_TOKEN
+
+
+class Capture:
+    """cProfile and tracemalloc running for one rerun"""
+
+    def __init__(self, page, username):
+        global _tracing_captures
+        self.page = page
+        self.user_hash = hashlib.sha256(username.encode()).hexdigest()[:12]
+        self.started = datetime.now()
+        with _tracing_lock:
+            if _tracing_captures == 0:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            _tracing_captures += 1
+        tracemalloc.reset_peak()
+        self.before = tracemalloc.take_snapshot()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def finish(self):
+        """Stop capturing and write the files; returns the .prof path"""
+        global _tracing_captures
+        self.profiler.disable()
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        with _tracing_lock:
+            _tracing_captures -= 1
+            if _tracing_captures == 0:
+                tracemalloc.stop()
+
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        page = self.page.lower().replace(' ', '_')
+        stem = PROFILE_DIR / f"{self.started.strftime('%Y%m%d-%H%M%S-%f')}-{page}-{self.user_hash}"
+        self.profiler.dump_stats(f'{stem}.prof')
+
+        functions = io.StringIO()
+        pstats.Stats(self.profiler, stream=functions).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        allocations = after.compare_to(self.before, 'traceback')[:TOP_ALLOCATIONS]
+        with open(f'{stem}.txt', 'w') as f:
+            f.write(f"page: {self.page}\nuser: {self.user_hash}\nstarted: {self.started.isoformat()}\n")
+            f.write(f"peak traced memory: {peak / 2**20:.1f} MiB\n\n")
+            f.write(f"== Top {TOP_ALLOCATIONS} allocation sites (growth over the rerun)\n")
+            for stat in allocations:
+                f.write(f"\n{stat.size_diff / 1024:+.1f} KiB in {stat.count_diff:+d} blocks\n")
+                f.write('\n'.join(f"    {line}" for line in stat.traceback.format()) + '\n')
+            f.write(f"\n== Top {TOP_FUNCTIONS} functions by cumulative time\n")
+            f.write(functions.getvalue())
+        return f'{stem}.prof'
+
+
+def start(page, username, query_params):
+    """Begin capturing this rerun if requested"""
+    # A rerun cut short (st.rerun) never reached finish(); end its capture now
+    finish()
+    if requested(query_params):
+        _local.capture = Capture(page, username)
+
+
+def finish():
+    """Write the capture of the current rerun, if one is running"""
+    capture = getattr(_local, 'capture', None)
+    if capture is not None:
+        _local.capture = None
+        return capture.finish()
+    return None
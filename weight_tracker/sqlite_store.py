@@ -0,0 +1,342 @@
+"""SQLite storage engine for weight entries, profiles and user accounts.
+
+Selected with ``WEIGHT_TRACKER_STORAGE=sqlite``; the database file defaults
+to ``weight_tracker.db`` and can be moved with ``WEIGHT_TRACKER_DB``.
+Existing CSV/JSON files are imported once with::
+
+    python -m weight_tracker.sqlite_store [data_dir]
+"""
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from weight_tracker import binary_store, columnar_store
+
+DB_PATH = os.environ.get('WEIGHT_TRACKER_DB', 'weight_tracker.db')
+POOL_SIZE = int(os.environ.get('WEIGHT_TRACKER_DB_POOL', '4'))
+
+ENTRY_COLUMNS = ['date', 'weight', 'notes', 'goal']
+
+# Dates are stored as fixed-width ISO text so string order is date order
+# and range filters can use the (username, date) index directly
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    security_question TEXT,
+    security_answer TEXT
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    username TEXT PRIMARY KEY,
+    profile TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    date TEXT NOT NULL,
+    weight REAL NOT NULL,
+    notes TEXT,
+    goal TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_entries_username_date ON entries (username, date);
+CREATE TABLE IF NOT EXISTS data_versions (
+    username TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+
+class ConnectionPool:
+    """Small pool of SQLite connections shared by Streamlit's session threads"""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with self._schema_lock:
+            if not self._schema_ready:
+                conn.executescript(SCHEMA)
+                self._schema_ready = True
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; the block runs as a single transaction"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+
+_pool = ConnectionPool(DB_PATH)
+
+
+def _bump_version(conn, username):
+    conn.execute(
+        "INSERT INTO data_versions (username, version) VALUES (?, 1) "
+        "ON CONFLICT(username) DO UPDATE SET version = version + 1",
+        (username,)
+    )
+
+
+def _entry_rows(df, username):
+    dates = pd.to_datetime(df['date']).dt.strftime(DATE_FORMAT)
+    notes = df['notes'] if 'notes' in df.columns else pd.Series(None, index=df.index)
+    goals = df['goal'] if 'goal' in df.columns else pd.Series(None, index=df.index)
+    return [
+        (username, date, float(weight), None if pd.isna(note) else str(note), None if pd.isna(goal) else goal)
+        for date, weight, note, goal in zip(dates, df['weight'], notes, goals)
+    ]
+
+
+def data_version(username):
+    """Counter bumped on every write to a user's entries"""
+    with _pool.connection() as conn:
+        row = conn.execute("SELECT version FROM data_versions WHERE username = ?", (username,)).fetchone()
+    return row[0] if row else 0
+
+
+def load_data(username, since=None, columns=None):
+    """Load a user's entries in date order.
+
+    since limits the scan to entries on or after that date; columns selects
+    a subset of date/weight/notes/goal.
+    """
+    columns = [name for name in ENTRY_COLUMNS if name in (columns or ENTRY_COLUMNS)]
+    query = f"SELECT {', '.join(columns)} FROM entries WHERE username = ?"
+    params = [username]
+    if since is not None:
+        query += " AND date >= ?"
+        params.append(pd.Timestamp(since).strftime(DATE_FORMAT))
+    query += " ORDER BY date, id"
+    with _pool.connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'], format=DATE_FORMAT)
+    return df
+
+
+def load_tail(username, rows=None, days=None, columns=None):
+    """A user's last rows entries, or those within days of the latest one, in date order.
+
+    Both are range scans from the end of the (username, date) index.
+    """
+    if days is not None:
+        with _pool.connection() as conn:
+            last = conn.execute("SELECT MAX(date) FROM entries WHERE username = ?", (username,)).fetchone()[0]
+        since = None if last is None else pd.Timestamp(last) - pd.Timedelta(days=days)
+        return load_data(username, since, columns)
+    columns = [name for name in ENTRY_COLUMNS if name in (columns or ENTRY_COLUMNS)]
+    query = f"SELECT {', '.join(columns)} FROM entries WHERE username = ? ORDER BY date DESC, id DESC LIMIT ?"
+    with _pool.connection() as conn:
+        df = pd.read_sql_query(query, conn, params=[username, rows])
+    df = df.iloc[::-1].reset_index(drop=True)
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'], format=DATE_FORMAT)
+    return df
+
+
+def save_data(df, username):
+    """Replace all of a user's entries"""
+    rows = _entry_rows(df, username)
+    with _pool.connection() as conn:
+        conn.execute("DELETE FROM entries WHERE username = ?", (username,))
+        conn.executemany(
+            "INSERT INTO entries (username, date, weight, notes, goal) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        _bump_version(conn, username)
+
+
+def write_chunks(chunks, username):
+    """Replace a user's entries with a stream of frames, in one transaction"""
+    with _pool.connection() as conn:
+        conn.execute("DELETE FROM entries WHERE username = ?", (username,))
+        for chunk in chunks:
+            conn.executemany(
+                "INSERT INTO entries (username, date, weight, notes, goal) VALUES (?, ?, ?, ?, ?)",
+                _entry_rows(chunk, username)
+            )
+        _bump_version(conn, username)
+
+
+def append_entries(entries, username):
+    """Insert entries in one transaction; the index keeps them in date order"""
+    rows = _entry_rows(pd.DataFrame(entries), username)
+    with _pool.connection() as conn:
+        conn.executemany(
+            "INSERT INTO entries (username, date, weight, notes, goal) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        _bump_version(conn, username)
+
+
+def delete_data(username):
+    """Remove a user's entries and profile; returns True if anything existed"""
+    with _pool.connection() as conn:
+        deleted = conn.execute("DELETE FROM entries WHERE username = ?", (username,)).rowcount
+        deleted += conn.execute("DELETE FROM profiles WHERE username = ?", (username,)).rowcount
+        _bump_version(conn, username)
+    return deleted > 0
+
+
+def load_user_profile(username):
+    """Return a user's profile dict, or None if they don't have one"""
+    with _pool.connection() as conn:
+        row = conn.execute("SELECT profile FROM profiles WHERE username = ?", (username,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def save_user_profile(profile, username):
+    with _pool.connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO profiles (username, profile) VALUES (?, ?)",
+            (username, json.dumps(profile))
+        )
+
+
+def load_users():
+    """Return all accounts in the same shape as users.json"""
+    with _pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT username, password, security_question, security_answer FROM users"
+        ).fetchall()
+    return {
+        username: {'password': password, 'security_question': question, 'security_answer': answer}
+        for username, password, question, answer in rows
+    }
+
+
+def get_user(username):
+    """Return a single account record, or None"""
+    with _pool.connection() as conn:
+        row = conn.execute(
+            "SELECT password, security_question, security_answer FROM users WHERE username = ?",
+            (username,)
+        ).fetchone()
+    if row is None:
+        return None
+    return {'password': row[0], 'security_question': row[1], 'security_answer': row[2]}
+
+
+def add_user(username, record):
+    """Insert an account unless the username is taken; returns True if inserted"""
+    with _pool.connection() as conn:
+        inserted = conn.execute(
+            "INSERT OR IGNORE INTO users (username, password, security_question, security_answer) "
+            "VALUES (?, ?, ?, ?)",
+            (username, record['password'], record.get('security_question'), record.get('security_answer'))
+        ).rowcount
+    return inserted == 1
+
+
+def has_users():
+    with _pool.connection() as conn:
+        return conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None
+
+
+def save_users(users):
+    """Upsert every account in a users.json-shaped dict"""
+    with _pool.connection() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO users (username, password, security_question, security_answer) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (username, user['password'], user.get('security_question'), user.get('security_answer'))
+                for username, user in users.items()
+            ]
+        )
+
+
+def _history_files(data_dir):
+    """Each user's weight history file, by username.
+
+    Switching to the Parquet or binary backend converts a user's CSV and
+    leaves it in place, no longer written to, so a converted file is
+    preferred (the most recently written, if there are both).
+    """
+    files = {}
+    for path in data_dir.glob("weight_data_*.csv"):
+        if path.name.endswith(".side.csv") and path.with_suffix("").with_suffix(".bin").exists():
+            continue  # Notes file of the binary backend, not a user's history
+        files[path.stem[len("weight_data_"):]] = path
+    converted = {}
+    for path in [*data_dir.glob("weight_data_*.parquet"), *data_dir.glob("weight_data_*.bin")]:
+        username = path.stem[len("weight_data_"):]
+        if username not in converted or path.stat().st_mtime_ns > converted[username].stat().st_mtime_ns:
+            converted[username] = path
+    files.update(converted)
+    return dict(sorted(files.items()))
+
+
+def _read_history_file(path):
+    if path.suffix == ".bin":
+        return binary_store.read_frame(path)
+    if path.suffix == ".parquet":
+        return columnar_store.read_frame(path).sort_values('date', kind='stable')
+    df = pd.read_csv(path)
+    df['date'] = pd.to_datetime(df['date'], format='ISO8601')
+    return df.sort_values('date', kind='stable')
+
+
+def migrate(data_dir='.'):
+    """One-shot import of users.json/users.log, user_profile_*.json and weight histories.
+
+    Each user's entries and profile replace whatever the database already
+    holds for them, so re-running the migration is safe.
+    """
+    data_dir = Path(data_dir)
+    counts = {'users': 0, 'profiles': 0, 'entries': 0}
+
+    from weight_tracker.users import read_account_files
+
+    users = read_account_files(data_dir)
+    save_users(users)
+    counts['users'] = len(users)
+
+    for profile_file in sorted(data_dir.glob("user_profile_*.json")):
+        username = profile_file.stem[len("user_profile_"):]
+        with open(profile_file, 'r') as f:
+            save_user_profile(json.load(f), username)
+        counts['profiles'] += 1
+
+    for username, path in _history_files(data_dir).items():
+        df = _read_history_file(path)
+        save_data(df, username)
+        stored = len(load_data(username, columns=['date']))
+        if stored != len(df):
+            raise RuntimeError(f"Migrated {stored} of {len(df)} entries from {path} for {username}")
+        counts['entries'] += len(df)
+
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import CSV/JSON weight tracker files into SQLite")
+    parser.add_argument("data_dir", nargs="?", default=".", help="Directory holding the existing files")
+    args = parser.parse_args()
+    counts = migrate(args.data_dir)
+    print(f"Migrated {counts['users']} users, {counts['profiles']} profiles and "
+          f"{counts['entries']} entries into {DB_PATH}")
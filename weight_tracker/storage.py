@@ -0,0 +1,1127 @@
+"""Persistence for per-user weight data and profiles.
+
+Streamlit re-executes ``streamlit_app.py`` from the top on every rerun, so
+state that has to outlive a single rerun (such as the load cache below)
+lives in this module, which Python imports only once per process.
+
+Files in the working directory are the default storage. Set
+``WEIGHT_TRACKER_STORAGE=parquet`` to keep weight histories as typed
+columnar files (``columnar_store``), ``binary`` for memory-mapped
+fixed-width series files (``binary_store``), or ``sqlite`` to use the
+SQLite engine in ``sqlite_store``.
+
+With ``WEIGHT_TRACKER_WRITE_BEHIND=1``, ``append_entry`` and
+``save_user_profile`` only queue the write and return; a background thread
+makes it durable, merging everything queued for a user into one write.
+Reads in the meantime include the queued writes, and whatever is still
+queued at exit is written then.
+"""
+import atexit
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from weight_tracker import binary_store, columnar_store, derived, sqlite_store
+from weight_tracker.date_index import DateIndex
+from weight_tracker.summary import RECENT_ROWS, HistorySummary
+from weight_tracker.trend import TREND_WINDOW_DAYS, TrendWindow
+
+# 'csv' (files in the working directory), 'parquet', 'binary' or 'sqlite'
+STORAGE_BACKEND = os.environ.get('WEIGHT_TRACKER_STORAGE', 'csv')
+
+DATA_COLUMNS = ['date', 'weight', 'notes', 'goal']
+
+# Memory budget for cached frames and profiles (megabytes)
+CACHE_MAX_MB = float(os.environ.get('WEIGHT_TRACKER_CACHE_MB', '256'))
+
+# '1' queues entry and profile writes for a background writer
+WRITE_BEHIND = os.environ.get('WEIGHT_TRACKER_WRITE_BEHIND', '0') == '1'
+
+# First read size when reading a CSV history backwards from its end (doubles as needed)
+TAIL_BLOCK_BYTES = 8 * 1024
+
+# Seconds a changed summary waits before it's written to its file, so a run
+# of writes costs one file write
+SUMMARY_SAVE_DELAY_S = float(os.environ.get('WEIGHT_TRACKER_SUMMARY_SAVE_DELAY_S', '2'))
+
+
+class LRUCache:
+    """Thread-safe LRU cache of versioned values with a memory cap.
+
+    Each entry remembers the version it was stored under; a lookup with a
+    different version is a miss, so callers can key on file metadata and
+    never serve stale data after an external write.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (version, value, nbytes)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Return the cached value for key if it was stored under version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, value, nbytes):
+        """Store value, evicting least recently used entries over the cap"""
+        with self._lock:
+            self._discard(key)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (version, value, nbytes)
+            self._size += nbytes
+            while self._size > self.max_bytes:
+                _, (_, _, evicted_bytes) = self._entries.popitem(last=False)
+                self._size -= evicted_bytes
+
+    def invalidate(self, key):
+        """Drop a single entry"""
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[2]
+
+
+_cache = LRUCache(int(CACHE_MAX_MB * 1024 * 1024))
+
+# One lock per user so appends, full saves, profile saves and background
+# compaction of the same user's files never interleave; different users
+# never contend (accounts have their own lock in users)
+_user_locks = {}
+_user_locks_guard = threading.Lock()
+
+
+def _user_lock(username):
+    with _user_locks_guard:
+        return _user_locks.setdefault(username, threading.RLock())
+
+
+def _write_atomic(path, write):
+    """Write a text file through write(f) next to path, then rename it over path.
+
+    Readers never take a lock, so they must only ever see a complete old
+    or a complete new file. Callers hold the user's lock, which keeps the
+    temporary name free.
+    """
+    tmp_path = Path(f"{path}.tmp")
+    try:
+        with open(tmp_path, 'w', newline='') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def memoize(key, version, build, nbytes=len):
+    """Return build() cached under (key, version) in the shared LRU cache"""
+    value = _cache.get(key, version)
+    if value is None:
+        value = build()
+        _cache.put(key, version, value, nbytes(value))
+    return value
+
+
+def _data_path(username):
+    return Path(f"weight_data_{username}.csv")
+
+
+def _parquet_path(username):
+    return Path(f"weight_data_{username}.parquet")
+
+
+def _binary_path(username):
+    return Path(f"weight_data_{username}.bin")
+
+
+def _history_path(username):
+    """Data file for the configured file backend"""
+    if STORAGE_BACKEND in ('parquet', 'binary'):
+        path, store = {
+            'parquet': (_parquet_path(username), columnar_store),
+            'binary': (_binary_path(username), binary_store),
+        }[STORAGE_BACKEND]
+        csv_path = _data_path(username)
+        if not path.exists() and csv_path.exists():
+            # Transparently convert histories saved before switching backends
+            with _user_lock(username):
+                if not path.exists():
+                    store.convert_csv(csv_path, path)
+        return path
+    return _data_path(username)
+
+
+def _averages_path(username):
+    return Path(f"weight_avgs_{username}.csv")
+
+
+def _summary_path(username):
+    return Path(f"weight_summary_{username}.json")
+
+
+def _profile_path(username):
+    return Path(f"user_profile_{username}.json")
+
+
+def file_version(path):
+    """Cheap content version for a file: (mtime in ns, size), or None if missing"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _sorted_by_date(df):
+    if not df['date'].is_monotonic_increasing:
+        # An out-of-order append whose background compaction hasn't finished yet
+        df = df.sort_values('date', kind='stable', ignore_index=True)
+    return df
+
+
+def _read_csv(csv_path):
+    df = pd.read_csv(csv_path)
+    # Everything the app writes is ISO 8601; allow date-only and timestamped rows to mix
+    df['date'] = pd.to_datetime(df['date'], format='ISO8601')
+    return _sorted_by_date(df)
+
+
+def _read_history(path, columns=None):
+    if path.suffix == '.parquet':
+        return _sorted_by_date(columnar_store.read_frame(path, columns))
+    if path.suffix == '.bin':
+        # Kept in date order on disk
+        return binary_store.read_frame(path, columns)
+    return _read_csv(path)
+
+
+def _frame_nbytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _load_shared(username, path, version):
+    """Return the cached frame for version, parsing the file on a miss (not a copy)"""
+    key = ('data', username)
+    df = _cache.get(key, version)
+    if df is None:
+        df = _read_history(path)
+        _cache.put(key, version, df, _frame_nbytes(df))
+    return df
+
+
+def _stored_version(username):
+    if STORAGE_BACKEND == 'sqlite':
+        return ('sqlite', sqlite_store.data_version(username))
+    return file_version(_history_path(username))
+
+
+def data_version(username):
+    """Token that changes whenever a user's weight data changes"""
+    pending = _pending.get(username)
+    if pending is not None and pending['entries']:
+        return (_stored_version(username), 'pending', pending['seq'])
+    return _stored_version(username)
+
+
+def load_data(username, since=None, columns=None):
+    """Load weight data for a user.
+
+    since limits the result to entries on or after that date and columns
+    to a subset of the frame's columns (charts only need date and weight).
+    """
+    if not _pending_entries(username):
+        return _load_stored(username, since, columns)
+    # Queued entries are read under the user's lock, which the writer holds
+    # from taking them off the queue until they are on disk
+    with _user_lock(username):
+        entries = _pending_entries(username)
+        df = _load_stored(username, since, columns)
+    return _with_entries(df, entries, since) if entries else df
+
+
+def _with_entries(df, entries, since=None):
+    """df (a stored history) with entries added, in date order"""
+    rows = _entries_frame(entries)
+    if since is not None:
+        rows = rows[rows['date'] >= pd.Timestamp(since)]
+    rows = rows.reindex(columns=df.columns)
+    return _sorted_by_date(pd.concat([df, rows], ignore_index=True) if len(df) else rows)
+
+
+def _entries_frame(entries):
+    rows = pd.DataFrame(entries)
+    rows['date'] = pd.to_datetime(rows['date'])
+    return rows
+
+
+def _load_stored(username, since=None, columns=None):
+    if STORAGE_BACKEND == 'sqlite':
+        if since is not None:
+            # Indexed range scan on (username, date)
+            return sqlite_store.load_data(username, since, columns)
+        key = ('data', username)
+        version = ('sqlite', sqlite_store.data_version(username))
+        df = _cache.get(key, version)
+        if df is None:
+            df = sqlite_store.load_data(username)
+            _cache.put(key, version, df, _frame_nbytes(df))
+        return (df[columns] if columns else df).copy()
+
+    path = _history_path(username)
+    version = file_version(path)
+    if version is None:
+        # Return empty DataFrame for new users
+        return pd.DataFrame(columns=columns or DATA_COLUMNS)
+
+    df = _cache.get(('data', username), version)
+    if df is None and columns and path.suffix in ('.parquet', '.bin'):
+        # Columnar and series files can read just the projected columns
+        df = _read_history(path, columns)
+    elif df is None:
+        df = _load_shared(username, path, version)
+    if since is not None:
+        # Frames are kept sorted, so the range starts at a binary-searched row
+        df = df.iloc[df['date'].searchsorted(pd.Timestamp(since)):]
+    if columns:
+        df = df[columns]
+    # Callers add columns and reassign freely, so hand out a private copy
+    return df.copy()
+
+
+def load_tail(username, rows=None, days=None, columns=None):
+    """The last rows entries of a user, or those within days of the latest one.
+
+    Only the end of the stored history is read (unless the whole frame is
+    cached anyway), so the cost doesn't grow with the history's length.
+    Pass one of rows and days.
+    """
+    if (rows is None) == (days is None):
+        raise ValueError("Pass one of rows and days")
+    read_columns = columns if columns is None or 'date' in columns else ['date'] + columns
+    if not _pending_entries(username):
+        df = _tail(_load_stored_tail(username, rows, days, read_columns), rows, days)
+    else:
+        with _user_lock(username):
+            entries = _pending_entries(username)
+            df = _load_stored_tail(username, rows, days, read_columns)
+        df = _tail(_with_entries(df, entries) if entries else df, rows, days)
+    return (df[columns] if columns else df).reset_index(drop=True)
+
+
+def load_series(username):
+    """A user's entry dates and weights as NumPy arrays, in date order.
+
+    For reads that don't need notes (charts, statistics, index rebuilds).
+    With the binary backend (and nothing queued) the dates are a read-only
+    view of the memory-mapped series file and the side file isn't read, so
+    only the weights are decoded (widened as by load_data). Otherwise they
+    come from load_data.
+    """
+    if STORAGE_BACKEND == 'binary' and not _pending_entries(username):
+        path = _history_path(username)
+        if path.exists():
+            dates, weights = binary_store.read_series(path)
+            return dates, binary_store.stored_weights(weights)
+    df = load_data(username, columns=['date', 'weight'])
+    return df['date'].to_numpy(dtype='datetime64[ns]'), df['weight'].to_numpy(dtype=float)
+
+
+def _series_frame(username):
+    dates, weights = load_series(username)
+    return pd.DataFrame({'date': dates, 'weight': weights}, copy=False)
+
+
+def _tail(df, rows=None, days=None):
+    """The last rows of a date-sorted frame, or those within days of its last date"""
+    if rows is not None:
+        return df.iloc[max(len(df) - rows, 0):]
+    if len(df) == 0:
+        return df
+    return df.iloc[df['date'].searchsorted(df['date'].iat[-1] - pd.Timedelta(days=days)):]
+
+
+def _load_stored_tail(username, rows, days, columns):
+    if STORAGE_BACKEND == 'sqlite':
+        key = ('data', username)
+        df = _cache.get(key, ('sqlite', sqlite_store.data_version(username)))
+        if df is None:
+            return sqlite_store.load_tail(username, rows, days, columns)
+        return _tail(df[columns] if columns else df, rows, days).copy()
+
+    path = _history_path(username)
+    version = file_version(path)
+    if version is None:
+        return pd.DataFrame(columns=columns or DATA_COLUMNS)
+    df = _cache.get(('data', username), version)
+    if df is None and path.suffix == '.parquet':
+        df = _sorted_by_date(columnar_store.read_tail(path, rows, days, columns))
+    elif df is None and path.suffix == '.bin':
+        df = binary_store.read_tail(path, rows, days, columns)
+    elif df is None:
+        df = _read_csv_tail(path, rows, days)
+        if df is None:
+            df = _load_shared(username, path, version)
+    return _tail(df[columns] if columns else df, rows, days).copy()
+
+
+def _read_csv_tail(csv_path, rows=None, days=None):
+    """The end of a CSV history, read backwards in growing blocks.
+
+    Returns at least the last rows rows, or every row within days of the
+    last one; None when the end can't be read on its own: rows out of date
+    order (an out-of-order append not compacted yet) or a quoted value
+    spanning lines.
+    """
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+        if not header:
+            return pd.DataFrame(columns=DATA_COLUMNS)
+        body_start = f.tell()
+        end = f.seek(0, os.SEEK_END)
+        block = TAIL_BLOCK_BYTES
+        while True:
+            start = max(body_start, end - block)
+            f.seek(start)
+            lines = f.read(end - start).split(b'\n')
+            if start > body_start:
+                lines = lines[1:]  # Starts mid-line (or the line is read again next round)
+            lines = [line for line in lines if line.strip()]
+            if any(line.count(b'"') % 2 for line in lines):
+                return None
+            df = pd.read_csv(io.BytesIO(header + b'\n'.join(lines)))
+            df['date'] = pd.to_datetime(df['date'], format='ISO8601')
+            if not df['date'].is_monotonic_increasing:
+                return None
+            if start == body_start:
+                return df
+            if rows is not None and len(df) >= rows:
+                return df
+            if days is not None and len(df) and df['date'].iat[0] < df['date'].iat[-1] - pd.Timedelta(days=days):
+                return df
+            block *= 2
+
+
+# Small per-user structures derived from the history. They are cached next
+# to the data and every write path updates them (from_frame, extend)
+# rather than dropping them, so they are only built from the stored
+# history after a restart, eviction or an external change. extend may
+# return None when a write can't be applied in place.
+# The summary is also persisted (see _save_summary), so the Dashboard
+# doesn't read the history even after a restart.
+_INDEXES = {'dates': DateIndex, 'trend': TrendWindow, 'ewma': derived.EwmaTrend, 'summary': HistorySummary}
+
+
+def _index(kind, username):
+    version = data_version(username)
+    index = _cache.get((kind, username), version)
+    if index is None and kind == 'summary':
+        index = _read_summary(username, version)
+        if index is not None:
+            _cache.put((kind, username), version, index, index.nbytes)
+    if index is None:
+        cls = _INDEXES[kind]
+        if kind == 'trend':
+            # The window only spans the latest entries
+            index = cls.from_frame(load_tail(username, days=TREND_WINDOW_DAYS, columns=['date', 'weight']))
+        elif kind == 'summary':
+            # Notes are only kept for the latest entries: read just those
+            recent = load_tail(username, rows=RECENT_ROWS, columns=['notes'])
+            index = cls.from_frame(_series_frame(username), recent['notes'])
+        else:
+            index = cls.from_frame(_series_frame(username))
+        if kind == 'ewma':
+            _put_trend(username, index, version)
+        else:
+            _put_indexes(username, {kind: index}, version)
+    return index
+
+
+def date_index(username):
+    """DateIndex of a user's entry days and latest entry"""
+    return _index('dates', username)
+
+
+def trend_window(username):
+    """TrendWindow over a user's latest entries (weekly_rate() is O(1))"""
+    return _index('trend', username)
+
+
+def latest_trend(username):
+    """Current value of the user's smoothed trend line, or None without entries"""
+    return _index('ewma', username).value
+
+
+def history_summary(username):
+    """HistorySummary of a user's history (what the Dashboard shows)"""
+    return _index('summary', username)
+
+
+def _is_stored(version):
+    return not (isinstance(version, tuple) and len(version) == 3 and version[1] == 'pending')
+
+
+def _read_summary(username, version):
+    """The persisted summary if it was written for version, else None"""
+    if not _is_stored(version):
+        return None
+    try:
+        with open(_summary_path(username)) as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if data.get('version') != json.loads(json.dumps(version)):
+        return None
+    return HistorySummary.from_dict(data)
+
+
+_unsaved_summaries = {}  # username -> (summary, stored data version)
+_unsaved_summaries_lock = threading.Lock()
+
+
+def _schedule_summary(username, summary, version):
+    """Have a changed summary written to its file SUMMARY_SAVE_DELAY_S from now.
+
+    Writes in the meantime only replace the summary to write, so a burst of
+    appends costs one file write. The file is only a head start after a
+    restart (it's ignored unless written for the stored version), so
+    losing the latest one in a crash costs a rebuild, nothing more.
+    """
+    with _unsaved_summaries_lock:
+        scheduled = username in _unsaved_summaries
+        _unsaved_summaries[username] = (summary, version)
+    if not scheduled:
+        timer = threading.Timer(SUMMARY_SAVE_DELAY_S, _save_summary, args=(username,))
+        timer.daemon = True
+        timer.start()
+
+
+def _save_summary(username):
+    """Write a user's changed summary to its file (skipped once the data moved on)"""
+    with _user_lock(username):
+        with _unsaved_summaries_lock:
+            summary, version = _unsaved_summaries.pop(username, (None, None))
+        if summary is None or version != _stored_version(username):
+            return
+        data = {'version': version, **summary.to_dict()}
+        _write_atomic(_summary_path(username), lambda f: json.dump(data, f))
+
+
+def _save_summaries():
+    for username in list(_unsaved_summaries):
+        _save_summary(username)
+
+
+atexit.register(_save_summaries)
+
+
+def _cached_indexes(username, version):
+    """The indexes cached for a data version, by kind"""
+    indexes = {}
+    for kind in _INDEXES:
+        index = _cache.get((kind, username), version)
+        if index is not None:
+            indexes[kind] = index
+    return indexes
+
+
+def _put_indexes(username, indexes, version=None):
+    """Cache indexes under a data version, the current one by default (None drops one).
+
+    Writers pass the stored version they just wrote: with write-behind, the
+    current version may already include entries queued meanwhile.
+    """
+    if version is None:
+        version = data_version(username)
+    for kind, index in indexes.items():
+        if index is None:
+            _cache.invalidate((kind, username))
+        else:
+            _cache.put((kind, username), version, index, index.nbytes)
+    summary = indexes.get('summary')
+    if summary is not None and version is not None and _is_stored(version):
+        _schedule_summary(username, summary, version)
+
+
+def _put_trend(username, ewma, version):
+    """Cache a recomputed trend, also in a summary that lost it to an out-of-order entry"""
+    indexes = {'ewma': ewma}
+    summary = _cache.get(('summary', username), version)
+    if summary is not None and summary.ewma is None:
+        indexes['summary'] = summary.with_trend(ewma)
+    _put_indexes(username, indexes, version)
+
+
+def _indexes_from_frame(df):
+    return {kind: cls.from_frame(df) for kind, cls in _INDEXES.items()}
+
+
+def _indexes_with_entries(indexes, entries):
+    dates = pd.to_datetime([entry['date'] for entry in entries])
+    weights = [entry['weight'] for entry in entries]
+    notes = [entry.get('notes') for entry in entries]
+    return {kind: index.extend(dates, weights, notes) for kind, index in indexes.items()}
+
+
+def save_data(df, username):
+    """Save weight data to user-specific CSV file"""
+    with _user_lock(username):
+        # df replaces the history, queued entries included
+        _drop_pending(username, entries=True)
+        _save_data(df, username)
+
+
+def _save_data(df, username):
+    with _user_lock(username):
+        if STORAGE_BACKEND == 'sqlite':
+            sqlite_store.save_data(df, username)
+        elif STORAGE_BACKEND == 'parquet':
+            columnar_store.write_frame(df, _parquet_path(username))
+        elif STORAGE_BACKEND == 'binary':
+            binary_store.write_frame(_sorted_by_date(df), _binary_path(username))
+        else:
+            _write_atomic(_data_path(username), lambda f: df.to_csv(f, index=False))
+        _cache.invalidate(('data', username))
+        version = _stored_version(username)
+        _put_indexes(username, _indexes_from_frame(df), version)
+        _sync_averages(username, df, version)
+
+
+def write_history(username, chunks, columns=DATA_COLUMNS):
+    """Replace a user's history with date-sorted chunks, streamed to storage.
+
+    Only one chunk is in memory at a time; the indexes are built as the
+    chunks pass through. The moving-average sidecar is caught up on the
+    next load_moving_averages call.
+    """
+    indexes = {kind: cls() for kind, cls in _INDEXES.items()}
+
+    def indexed(chunks):
+        nonlocal indexes
+        for chunk in chunks:
+            notes = chunk.get('notes')
+            indexes = {kind: index.extend(chunk['date'], chunk['weight'], notes) for kind, index in indexes.items()}
+            yield chunk.reindex(columns=columns)
+
+    chunks = indexed(chunks)
+    with _user_lock(username):
+        _drop_pending(username, entries=True)
+        if STORAGE_BACKEND == 'sqlite':
+            sqlite_store.write_chunks(chunks, username)
+        elif STORAGE_BACKEND == 'parquet':
+            columnar_store.write_chunks(chunks, _parquet_path(username))
+        elif STORAGE_BACKEND == 'binary':
+            binary_store.write_chunks(chunks, _binary_path(username))
+        else:
+            def write(f):
+                f.write(','.join(columns) + '\n')
+                for chunk in chunks:
+                    chunk.to_csv(f, header=False, index=False)
+
+            _write_atomic(_data_path(username), write)
+        _cache.invalidate(('data', username))
+        _put_indexes(username, indexes, _stored_version(username))
+
+
+def append_entry(entry, username):
+    """Append a single weight entry without rewriting the user's whole file.
+
+    An entry dated on or after the current last entry (the normal case) costs
+    one appended, fsync'd line. An older entry is appended the same way and a
+    background compaction then restores date order on disk; load_data sorts
+    in memory until that has finished.
+
+    Parquet files can't be appended to, so with that backend the entry is
+    merged into the cached frame and the file is rewritten.
+
+    With write-behind enabled, the entry is queued and written shortly after.
+    """
+    if WRITE_BEHIND:
+        _queue_write(username, entry=entry)
+    else:
+        _append_entries([entry], username)
+
+
+def _append_entries(entries, username, indexes=None):
+    """Append entries in one write. indexes, if given, already include them."""
+    rows = _entries_frame(entries).sort_values('date', kind='stable', ignore_index=True)
+
+    if STORAGE_BACKEND == 'sqlite':
+        with _user_lock(username):
+            if indexes is None:
+                indexes = _indexes_with_entries(_cached_indexes(username, _stored_version(username)), entries)
+            sqlite_store.append_entries(entries, username)
+            _put_indexes(username, indexes, _stored_version(username))
+        return
+
+    if STORAGE_BACKEND == 'parquet':
+        with _user_lock(username):
+            path = _history_path(username)
+            version = file_version(path)
+            if version is None:
+                stored = 0
+                updated = rows.reindex(columns=DATA_COLUMNS)
+            else:
+                current = _load_shared(username, path, version)
+                stored = len(current)
+                updated = _sorted_by_date(pd.concat([current, rows], ignore_index=True))
+            if indexes is None:
+                indexes = _indexes_with_entries(_cached_indexes(username, version), entries)
+            columnar_store.write_frame(updated, path)
+            version = file_version(path)
+            _cache.put(('data', username), version, updated, _frame_nbytes(updated))
+            _put_indexes(username, indexes, version)
+            _append_averages(username, rows, stored, version)
+        return
+
+    if STORAGE_BACKEND == 'binary':
+        with _user_lock(username):
+            path = _history_path(username)
+            version = file_version(path)
+            if indexes is None:
+                indexes = _indexes_with_entries(_cached_indexes(username, version), entries)
+            rows['weight'] = binary_store.stored_weights(rows['weight'])
+            last = None if version is None else binary_store.last_date(path)
+            stored = 0 if version is None else os.path.getsize(path) // binary_store.RECORD.itemsize
+            if version is None:
+                updated = rows.reindex(columns=DATA_COLUMNS)
+                binary_store.write_frame(updated, path)
+            elif last is None or rows['date'].iat[0] >= last:
+                # The normal case: records go on the end of the mapped file
+                binary_store.append_frame(rows, path)
+                current = _cache.get(('data', username), version)
+                updated = None if current is None else pd.concat(
+                    [current, rows.reindex(columns=current.columns)], ignore_index=True
+                )
+            else:
+                updated = _sorted_by_date(pd.concat([_load_shared(username, path, version), rows], ignore_index=True))
+                binary_store.write_frame(updated, path)
+            version = file_version(path)
+            if updated is not None:
+                _cache.put(('data', username), version, updated, _frame_nbytes(updated))
+            _put_indexes(username, indexes, version)
+            _append_averages(username, rows, stored, version)
+        return
+
+    csv_path = _data_path(username)
+    with _user_lock(username):
+        version = file_version(csv_path)
+        if version is None or version[1] == 0:
+            _save_data(rows.reindex(columns=DATA_COLUMNS), username)
+            return
+
+        current = _load_shared(username, csv_path, version)
+        if indexes is None:
+            indexes = _indexes_with_entries(_cached_indexes(username, version), entries)
+        # Match the column layout of the existing file (imports may add columns)
+        with open(csv_path, 'r', newline='') as f:
+            header = next(csv.reader(f))
+        rows = rows.reindex(columns=header)
+
+        with open(csv_path, 'a', newline='') as f:
+            # One write call, so a concurrent reader sees whole lines or none of them
+            f.write(rows.to_csv(header=False, index=False))
+            f.flush()
+            os.fsync(f.fileno())
+
+        in_order = len(current) == 0 or rows['date'].iat[0] >= current['date'].iat[-1]
+        if len(current) == 0:
+            updated = rows
+        else:
+            updated = pd.concat([current, rows], ignore_index=True)
+        if not in_order:
+            updated = updated.sort_values('date', kind='stable', ignore_index=True)
+        # Write through so the next rerun doesn't re-parse the file
+        version = file_version(csv_path)
+        _cache.put(('data', username), version, updated, _frame_nbytes(updated))
+        _put_indexes(username, indexes, version)
+        _append_averages(username, rows, len(current), version)
+
+    if not in_order:
+        threading.Thread(target=_compact_data, args=(username,), daemon=True).start()
+
+
+def _compact_data(username):
+    """Rewrite a user's CSV in date order after an out-of-order append"""
+    csv_path = _data_path(username)
+    with _user_lock(username):
+        version = file_version(csv_path)
+        if version is None:
+            return
+        indexes = _cached_indexes(username, version)
+        df = _read_csv(csv_path)
+        _write_atomic(csv_path, lambda f: df.to_csv(f, index=False))
+        version = file_version(csv_path)
+        _cache.put(('data', username), version, df, _frame_nbytes(df))
+        # Same entries in a new file: the indexes carry over unchanged
+        _put_indexes(username, indexes, version)
+
+
+def _read_averages(username):
+    """(file version, frame) of a user's moving-average sidecar; the frame is
+    None if there is none or it was built for other windows or smoothing"""
+    path = _averages_path(username)
+    version = file_version(path)
+    if version is None:
+        return None, None
+    old = _cache.get(('averages', username), version)
+    if old is None:
+        old = pd.read_csv(path)
+        old['date'] = pd.to_datetime(old['date'], format='ISO8601')
+    columns = ['date', 'weight'] + [f'avg_{w}' for w in derived.AVERAGE_WINDOWS] + [derived.TREND_COLUMN]
+    return version, (old if list(old.columns) == columns else None)
+
+
+def _averages_rows(old, start, dates, weights):
+    """Sidecar rows from start on for a history whose rows before start are
+    old's, given that history's dates and weights from start on"""
+    trend_column = derived.TREND_COLUMN
+    lo = max(0, start - max(derived.AVERAGE_WINDOWS, default=1) + 1)
+    prior = old['weight'].to_numpy(dtype=float)[lo:start] if start else np.empty(0)
+    means = derived.rolling_means(np.concatenate((prior, weights)), derived.AVERAGE_WINDOWS, start - lo)
+    tail = pd.DataFrame({'date': dates, 'weight': weights})
+    for window in derived.AVERAGE_WINDOWS:
+        tail[f'avg_{window}'] = means[window]
+    previous = (old['date'].iat[start - 1], old[trend_column].iat[start - 1]) if start else None
+    tail[trend_column] = derived.ewma_trend(dates, weights, derived.TREND_ALPHA, previous)
+    return tail
+
+
+def _append_averages(username, rows, stored, df_version):
+    """Add appended entries to the moving-average sidecar.
+
+    rows are the new entries in date order and stored the number of entries
+    the history held before them. The rows go in after the last sidecar row
+    dated on or before the first of them, and only the sidecar from there on
+    is recomputed: an in-order append costs O(len(rows)). A sidecar that
+    wasn't in step with the history is left for load_moving_averages to
+    catch up.
+    """
+    path = _averages_path(username)
+    key = ('averages', username)
+    trend_column = derived.TREND_COLUMN
+    new_dates = pd.to_datetime(rows['date']).to_numpy(dtype='datetime64[ns]')
+    new_weights = rows['weight'].to_numpy(dtype=float)
+
+    with _user_lock(username):
+        version, old = _read_averages(username)
+        if old is None or len(old) != stored or len(new_dates) == 0:
+            return
+        start = int(old['date'].searchsorted(new_dates[0], side='right'))
+        # Existing entries sort first on equal dates, as in the history
+        dates = np.concatenate((old['date'].to_numpy(dtype='datetime64[ns]')[start:], new_dates))
+        weights = np.concatenate((old['weight'].to_numpy(dtype=float)[start:], new_weights))
+        order = np.argsort(dates, kind='stable')
+        dates, weights = dates[order], weights[order]
+
+        tail = _averages_rows(old, start, dates, weights)
+        if start == len(old):
+            tail.to_csv(path, mode='a', header=False, index=False)
+            result = pd.concat([old, tail], ignore_index=True) if len(old) else tail
+        else:
+            # An out-of-order insert shifts the rows after it: rewrite the file
+            result = pd.concat([old.iloc[:start], tail], ignore_index=True) if start else tail
+            _write_atomic(path, lambda f: result.to_csv(f, index=False))
+        _cache.put(key, file_version(path), result, _frame_nbytes(result))
+        _put_trend(username, derived.EwmaTrend(dates[-1], float(tail[trend_column].iat[-1])), df_version)
+
+
+def _sync_averages(username, df, df_version=None):
+    """Bring the moving-average sidecar in line with a user's full history.
+
+    The sidecar keeps date and weight next to each average (and the smoothed
+    trend line) so it can find the first row a write changed and recompute
+    only from there: an in-order append touches one row and appends one
+    line, an out-of-order insert recomputes the suffix after it. Writers
+    pass df's data version, under which the latest trend value is cached.
+    """
+    path = _averages_path(username)
+    key = ('averages', username)
+    trend_column = derived.TREND_COLUMN
+    dates = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[ns]')
+    order = np.argsort(dates, kind='stable')
+    dates = dates[order]
+    weights = df['weight'].to_numpy(dtype=float)[order]
+
+    with _user_lock(username):
+        version, old = _read_averages(username)
+        start = 0
+        if old is not None:
+            start = derived.first_divergence(
+                old['date'].to_numpy(dtype='datetime64[ns]'), old['weight'].to_numpy(dtype=float), dates, weights
+            )
+            if start == len(old) == len(dates):
+                _cache.put(key, version, old, _frame_nbytes(old))
+                return old
+
+        tail = _averages_rows(old, start, dates[start:], weights[start:])
+
+        if old is not None and start == len(old):
+            tail.to_csv(path, mode='a', header=False, index=False)
+            result = pd.concat([old, tail], ignore_index=True) if len(old) else tail
+        else:
+            result = pd.concat([old.iloc[:start], tail], ignore_index=True) if start else tail
+            _write_atomic(path, lambda f: result.to_csv(f, index=False))
+        _cache.put(key, file_version(path), result, _frame_nbytes(result))
+        if len(result) and df_version is not None:
+            # Also what an out-of-order insert left the latest trend value at
+            _put_trend(username, derived.EwmaTrend(dates[-1], float(result[trend_column].iat[-1])), df_version)
+        return result
+
+
+def load_moving_averages(username, df):
+    """Persisted moving averages for a user's full history df, in date order.
+
+    Returns a frame with date, weight and one avg_<window> column per
+    configured window. Catches the sidecar up first if it's behind df (data
+    written by another tool, or a backend that doesn't maintain it on write).
+    """
+    return _sync_averages(username, df).copy()
+
+
+def delete_user_data(username):
+    """Delete a user's weight data and profile; returns False if there was none"""
+    with _user_lock(username):
+        _drop_pending(username, entries=True, profile=True)
+        with _unsaved_summaries_lock:
+            _unsaved_summaries.pop(username, None)
+    _cache.invalidate(('data', username))
+    _cache.invalidate(('averages', username))
+    for kind in _INDEXES:
+        _cache.invalidate((kind, username))
+    _cache.invalidate(('profile', username))
+    if STORAGE_BACKEND == 'sqlite':
+        for path in (_averages_path(username), _summary_path(username)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return sqlite_store.delete_data(username)
+
+    deleted = False
+    with _user_lock(username):
+        paths = (
+            _data_path(username), _parquet_path(username), _binary_path(username),
+            binary_store.side_path(_binary_path(username)), _averages_path(username),
+            _summary_path(username), _profile_path(username),
+        )
+        for path in paths:
+            try:
+                os.remove(path)
+                deleted = True
+            except FileNotFoundError:
+                pass
+    return deleted
+
+
+def _default_profile(username):
+    return {
+        'name': username.title(),
+        'goal': 'maintenance',
+        'target_weight': 85.0,
+        'current_weight': 85.0,
+        'height': 175.0  # cm
+    }
+
+
+def load_user_profile(username, create=True):
+    """Load user profile from user-specific JSON file.
+
+    Users without one get the default profile, saved for them unless
+    create is False (read-only callers such as batch reports).
+    """
+    pending = _pending.get(username)
+    if pending is not None and pending['profile'] is not None:
+        return dict(pending['profile'])
+
+    if STORAGE_BACKEND == 'sqlite':
+        profile = sqlite_store.load_user_profile(username)
+        if profile is None:
+            # Default profile for new users
+            profile = _default_profile(username)
+            if create:
+                save_user_profile(profile, username)
+        return profile
+
+    json_path = _profile_path(username)
+    version = file_version(json_path)
+    if version is None:
+        # Default profile for new users
+        default_profile = _default_profile(username)
+        if create:
+            save_user_profile(default_profile, username)
+        return default_profile
+
+    key = ('profile', username)
+    profile = _cache.get(key, version)
+    if profile is None:
+        with open(json_path, 'r') as f:
+            profile = json.load(f)
+        _cache.put(key, version, profile, version[1])
+    return dict(profile)
+
+
+def save_user_profile(profile, username):
+    """Save user profile to user-specific JSON file (queued with write-behind)"""
+    if WRITE_BEHIND:
+        _queue_write(username, profile=profile)
+    else:
+        _save_user_profile(profile, username)
+
+
+def _save_user_profile(profile, username):
+    if STORAGE_BACKEND == 'sqlite':
+        sqlite_store.save_user_profile(profile, username)
+        return
+
+    with _user_lock(username):
+        _write_atomic(_profile_path(username), lambda f: json.dump(profile, f))
+        _cache.invalidate(('profile', username))
+
+
+# Write-behind queue: writes queued per user, made durable by one background
+# thread. Everything queued for a user is written together; readers see it
+# through _pending (load_data, data_version, load_user_profile) until then.
+_pending = {}  # username -> {'entries': [...], 'profile': dict or None, 'seq': int}
+_pending_lock = threading.Lock()
+_pending_seq = itertools.count(1)
+_flush_queue = queue.Queue()
+_writer = None
+
+# Seconds before retrying a failed flush
+FLUSH_RETRY_S = 1.0
+
+
+def _pending_entries(username):
+    pending = _pending.get(username)
+    if pending is None:
+        return []
+    with _pending_lock:
+        return list(pending['entries'])
+
+
+def _queue_write(username, entry=None, profile=None):
+    """Queue an entry and/or profile; returns once readers can see it"""
+    global _writer
+    # A user's queue only changes under their lock, so the version and the
+    # indexes (which may stat or read files) are worked out under it and
+    # the process-wide _pending_lock is only held to queue
+    with _user_lock(username):
+        indexes = None
+        if entry is not None:
+            indexes = _indexes_with_entries(_cached_indexes(username, data_version(username)), [entry])
+        with _pending_lock:
+            pending = _pending.get(username)
+            if pending is None:
+                pending = _pending[username] = {'entries': [], 'profile': None, 'seq': 0}
+                _flush_queue.put(username)
+            if entry is not None:
+                pending['entries'].append(entry)
+                pending['seq'] = next(_pending_seq)
+            if profile is not None:
+                pending['profile'] = dict(profile)
+            if _writer is None:
+                _writer = threading.Thread(target=_write_behind, name='weight-tracker-writer', daemon=True)
+                _writer.start()
+        if indexes is not None:
+            # The cached indexes move on with the queue, under its new data version
+            _put_indexes(username, indexes)
+
+
+def _drop_pending(username, entries=False, profile=False):
+    """Forget queued writes a newer write supersedes (caller holds the user's lock)"""
+    with _pending_lock:
+        pending = _pending.get(username)
+        if pending is None:
+            return
+        if entries:
+            del pending['entries'][:]
+        if profile:
+            pending['profile'] = None
+
+
+def flush(username=None):
+    """Write queued writes (and changed summaries) now: one user's, or everyone's"""
+    for name in [username] if username is not None else list(_pending):
+        _flush_user(name)
+    if username is not None:
+        _save_summary(username)
+    else:
+        _save_summaries()
+
+
+def _flush_user(username):
+    # Holding the user's lock from before reading the queue until its writes
+    # are on disk and off the queue, so readers see each write exactly once
+    with _user_lock(username):
+        with _pending_lock:
+            pending = _pending.get(username)
+            if pending is None:
+                return
+            entries, profile, seq = list(pending['entries']), pending['profile'], pending['seq']
+        indexes = {}
+        if entries:
+            indexes = _cached_indexes(username, (_stored_version(username), 'pending', seq))
+            _append_entries(entries, username, indexes)
+        if profile is not None:
+            _save_user_profile(profile, username)
+
+        with _pending_lock:
+            del pending['entries'][:len(entries)]
+            if pending['profile'] is profile:
+                pending['profile'] = None
+            if not pending['entries'] and pending['profile'] is None:
+                del _pending[username]
+                return
+            # Queued while this flush was writing: flush again, and extend the
+            # indexes just written to those entries where queueing couldn't
+            _flush_queue.put(username)
+            version = data_version(username)
+            missing = {
+                kind: index for kind, index in indexes.items()
+                if index is not None and _cache.get((kind, username), version) is None
+            }
+            if missing and pending['entries']:
+                _put_indexes(username, _indexes_with_entries(missing, pending['entries']), version)
+
+
+def _write_behind():
+    while True:
+        username = _flush_queue.get()
+        try:
+            _flush_user(username)
+        except Exception:
+            logging.getLogger(__name__).exception("Queued writes for %s failed; retrying", username)
+            time.sleep(FLUSH_RETRY_S)
+            _flush_queue.put(username)
+
+
+if WRITE_BEHIND:
+    atexit.register(flush)
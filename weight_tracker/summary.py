@@ -0,0 +1,196 @@
+"""Per-user summary of a weight history: everything the Dashboard shows.
+
+Entry count, first and latest entry, weight range, the last few rows, the
+entries in the trend window, the smoothed trend's latest value and a
+downsampled copy of the series for the overview chart. ``storage`` keeps
+one per user next to the data (cached, and persisted as a small JSON
+sidecar), updated on every write, so the Dashboard never loads the
+history itself.
+
+The chart series starts as the LTTB downsample of the whole history;
+appended points are added as they come and the series is downsampled
+again once it has twice the points a chart needs, so it's an overview,
+not an exact LTTB of the current history.
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+
+from weight_tracker import core
+from weight_tracker.charts import CHART_WIDTH_PX, lttb_indices
+from weight_tracker.derived import EwmaTrend
+from weight_tracker.trend import TrendWindow
+
+# Rows kept for "Recent Entries"
+RECENT_ROWS = 5
+
+
+def _dates(values):
+    return np.asarray(pd.to_datetime(values), dtype='datetime64[ns]')
+
+
+def _merge(dates, weights, new_dates, new_weights):
+    """Two date-sorted runs merged by date (existing rows first on ties), and the merge order"""
+    dates = np.concatenate((dates, new_dates))
+    order = np.argsort(dates, kind='stable')
+    return dates[order], np.concatenate((weights, new_weights))[order], order
+
+
+def _downsampled(dates, weights, max_points):
+    if len(dates) <= max_points:
+        return dates, weights
+    keep = lttb_indices(dates.astype(np.int64), weights, max_points)
+    return dates[keep], weights[keep]
+
+
+def _note(value):
+    return None if value is None or pd.isna(value) else str(value)
+
+
+class HistorySummary:
+    """Summary of a history, updated per batch of entries in O(batch).
+
+    Instances are not modified; extend() returns a new one.
+    """
+
+    def __init__(self):
+        self.entries = 0
+        self.first_date = self.first_weight = None
+        self.last_date = self.last_weight = None
+        self.min_weight = self.max_weight = None
+        self.recent = (np.array([], dtype='datetime64[ns]'), np.array([]), [])
+        self.chart = (np.array([], dtype='datetime64[ns]'), np.array([]))
+        self.window = TrendWindow()
+        self.ewma = EwmaTrend()  # None after an out-of-order entry
+
+    @classmethod
+    def from_frame(cls, df, notes=None):
+        """Summary of a history frame with date, weight and (optionally) notes columns.
+
+        Only the latest entries' notes are kept, so without a notes column
+        they can be passed as notes instead, in date order.
+        """
+        dates, weights = _dates(df['date']), df['weight'].to_numpy(dtype=float)
+        summary = cls()
+        if len(dates) == 0:
+            return summary
+        if not (dates[1:] >= dates[:-1]).all():
+            order = np.argsort(dates, kind='stable')
+            dates, weights, df = dates[order], weights[order], df.iloc[order]
+        summary.entries = len(dates)
+        summary.first_date, summary.first_weight = dates[0], float(weights[0])
+        summary.last_date, summary.last_weight = dates[-1], float(weights[-1])
+        summary.min_weight, summary.max_weight = float(weights.min()), float(weights.max())
+        tail = slice(-RECENT_ROWS, None)
+        if 'notes' in df.columns:
+            notes = df['notes'].iloc[tail]
+        elif notes is None:
+            notes = [None] * len(dates[tail])
+        summary.recent = (dates[tail], weights[tail], [_note(note) for note in list(notes)[tail]])
+        # Built at once, the chart is the exact downsample of the history
+        summary.chart = _downsampled(dates, weights, CHART_WIDTH_PX)
+        summary.window = TrendWindow.from_frame(df)
+        summary.ewma = EwmaTrend.from_frame(df)
+        return summary
+
+    def extend(self, dates, weights, notes=None):
+        """Summary with a batch of entries added (in any order)"""
+        dates = _dates(dates)
+        weights = np.asarray(weights, dtype=float)
+        if len(dates) == 0:
+            return self
+        notes = np.full(len(dates), None) if notes is None else np.asarray(notes, dtype=object)
+        order = np.argsort(dates, kind='stable')
+        dates, weights, notes = dates[order], weights[order], notes[order]
+
+        summary = HistorySummary()
+        summary.entries = self.entries + len(dates)
+        if self.entries == 0 or dates[0] < self.first_date:
+            summary.first_date, summary.first_weight = dates[0], float(weights[0])
+        else:
+            summary.first_date, summary.first_weight = self.first_date, self.first_weight
+        if self.entries == 0 or dates[-1] >= self.last_date:
+            summary.last_date, summary.last_weight = dates[-1], float(weights[-1])
+        else:
+            summary.last_date, summary.last_weight = self.last_date, self.last_weight
+        summary.min_weight = float(weights.min()) if self.entries == 0 else min(self.min_weight, float(weights.min()))
+        summary.max_weight = float(weights.max()) if self.entries == 0 else max(self.max_weight, float(weights.max()))
+
+        tail = slice(-RECENT_ROWS, None)
+        recent_dates, recent_weights, order = _merge(*self.recent[:2], dates[tail], weights[tail])
+        recent_notes = list(self.recent[2]) + [_note(note) for note in notes[tail]]
+        summary.recent = (recent_dates[tail], recent_weights[tail], [recent_notes[i] for i in order[tail]])
+        chart_dates, chart_weights, _ = _merge(*self.chart, dates, weights)
+        if len(chart_dates) > 2 * CHART_WIDTH_PX:
+            chart_dates, chart_weights = _downsampled(chart_dates, chart_weights, CHART_WIDTH_PX)
+        summary.chart = (chart_dates, chart_weights)
+        summary.window = self.window.extend(dates, weights)
+        summary.ewma = self.ewma.extend(dates, weights) if self.ewma is not None else None
+        return summary
+
+    def with_trend(self, ewma):
+        """Summary with the trend's latest value replaced (after an out-of-order entry)"""
+        summary = copy.copy(self)
+        summary.ewma = ewma
+        return summary
+
+    def stats(self):
+        """The summary as core.history_stats returns it"""
+        if self.entries == 0:
+            return core.history_stats([], [])
+        return {
+            'entries': self.entries,
+            'start_weight': self.first_weight,
+            'current_weight': self.last_weight,
+            'min_weight': self.min_weight,
+            'max_weight': self.max_weight,
+            'last_date': self.last_date,
+        }
+
+    def recent_frame(self):
+        """The latest entries, newest first"""
+        dates, weights, notes = self.recent
+        return pd.DataFrame({'date': dates, 'weight': weights, 'notes': notes}).iloc[::-1].reset_index(drop=True)
+
+    def chart_frame(self):
+        """The overview chart's date and weight series"""
+        return pd.DataFrame({'date': self.chart[0], 'weight': self.chart[1]})
+
+    @property
+    def nbytes(self):
+        return int(self.chart[0].nbytes * 2 + self.window.nbytes) + 1024
+
+    def to_dict(self):
+        """JSON-serializable form (dates as integer nanoseconds)"""
+        ns = lambda dates: np.asarray(dates, dtype='datetime64[ns]').astype(np.int64).tolist()
+        scalar_ns = lambda date: None if date is None else int(np.datetime64(date, 'ns').astype(np.int64))
+        return {
+            'entries': self.entries,
+            'first': [scalar_ns(self.first_date), self.first_weight],
+            'last': [scalar_ns(self.last_date), self.last_weight],
+            'range': [self.min_weight, self.max_weight],
+            'recent': [ns(self.recent[0]), self.recent[1].tolist(), list(self.recent[2])],
+            'chart': [ns(self.chart[0]), self.chart[1].tolist()],
+            'window': [ns(self.window.dates), self.window.weights.tolist()],
+            'ewma': None if self.ewma is None else [scalar_ns(self.ewma.last_date), self.ewma.value],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Inverse of to_dict"""
+        dates = lambda values: np.array(values, dtype=np.int64).astype('datetime64[ns]')
+        scalar = lambda value: None if value is None else np.datetime64(value, 'ns')
+        summary = cls()
+        summary.entries = data['entries']
+        summary.first_date, summary.first_weight = scalar(data['first'][0]), data['first'][1]
+        summary.last_date, summary.last_weight = scalar(data['last'][0]), data['last'][1]
+        summary.min_weight, summary.max_weight = data['range']
+        summary.recent = (dates(data['recent'][0]), np.array(data['recent'][1], dtype=float), data['recent'][2])
+        summary.chart = (dates(data['chart'][0]), np.array(data['chart'][1], dtype=float))
+        summary.window = TrendWindow(dates(data['window'][0]), data['window'][1])
+        if data['ewma'] is not None:
+            summary.ewma = EwmaTrend(scalar(data['ewma'][0]), data['ewma'][1])
+        else:
+            summary.ewma = None
+        return summary
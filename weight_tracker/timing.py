@@ -0,0 +1,204 @@
+"""Timing spans around the app's expensive blocks, kept as latency histograms.
+
+Wrap a block in ``with span('load_data'):`` (or call ``start()`` and
+``stop()`` on a ``Span`` for blocks too long to indent). Each finished span
+is recorded under its name and the tags of the current rerun, set with
+``start_rerun(page=..., history=...)``; history sizes are bucketed so the
+number of series stays small. ``finish_rerun()`` records the rerun itself.
+
+Set ``WEIGHT_TRACKER_METRICS`` to a file to export them:
+
+- ``*.prom``: Prometheus text exposition of the histograms, rewritten at
+  most every ``WEIGHT_TRACKER_METRICS_INTERVAL`` seconds (for the node
+  exporter's textfile collector, or any scraper that reads a file)
+- anything else: one JSON line per span, for ad-hoc analysis with
+  ``python -m weight_tracker.timing <file>`` (p50/p90/p99 per span)
+
+Without it, spans are not timed at all.
+"""
+import argparse
+import atexit
+import json
+import os
+import threading
+import time
+
+# Where spans are exported ('' disables timing)
+METRICS_PATH = os.environ.get('WEIGHT_TRACKER_METRICS', '')
+
+# Minimum seconds between rewrites of a Prometheus file
+METRICS_INTERVAL = float(os.environ.get('WEIGHT_TRACKER_METRICS_INTERVAL', '10'))
+
+# Histogram bucket upper bounds in seconds (Prometheus 'le'), +Inf implied
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (upper bound, label) for tagging by history size
+HISTORY_BUCKETS = [(1, '0'), (1_000, '<1k'), (10_000, '<10k'), (100_000, '<100k'), (1_000_000, '<1m')]
+
+METRIC_NAME = 'weight_tracker_span_seconds'
+
+_histograms = {}  # (span, sorted tag items) -> [bucket counts..., sum, count]
+_lock = threading.Lock()
+_write_lock = threading.Lock()
+_last_write = 0.0
+# Streamlit runs each session's reruns on its own script thread
+_local = threading.local()
+
+
+def history_bucket(entries):
+    """Coarse label for a history of this many entries"""
+    for upper, label in HISTORY_BUCKETS:
+        if entries < upper:
+            return label
+    return '1m+'
+
+
+def start_rerun(**tags):
+    """Begin timing a rerun; tags apply to every span until the next one"""
+    _local.tags = {}
+    set_tags(**tags)
+    _local.rerun = Span('rerun').start() if METRICS_PATH else None
+
+
+def set_tags(**tags):
+    """Add or change tags of the current rerun (e.g. once the history is loaded)"""
+    if isinstance(tags.get('history'), int):
+        tags['history'] = history_bucket(tags['history'])
+    _local.tags = {**getattr(_local, 'tags', {}), **tags}
+
+
+def finish_rerun():
+    """Record the rerun started by start_rerun (reruns cut short aren't recorded)"""
+    rerun = getattr(_local, 'rerun', None)
+    _local.rerun = None
+    if rerun is not None:
+        rerun.stop()
+
+
+class Span:
+    """A timed block; a context manager, or started and stopped explicitly"""
+
+    def __init__(self, name, **tags):
+        self.name = name
+        self.tags = tags
+        self.started = None
+
+    def start(self):
+        if METRICS_PATH:
+            self.started = time.perf_counter()
+        return self
+
+    def stop(self):
+        """Record the span (once; later calls do nothing)"""
+        if self.started is not None:
+            record(self.name, time.perf_counter() - self.started, **self.tags)
+            self.started = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        # Also on Streamlit's stop/rerun exceptions: the work was done
+        self.stop()
+        return False
+
+
+def span(name, **tags):
+    """Span for a with block"""
+    return Span(name, **tags)
+
+
+def record(name, seconds, **tags):
+    """Add one observation of span name, tagged with the current rerun's tags"""
+    tags = {**getattr(_local, 'tags', {}), **tags}
+    key = (name, tuple(sorted((k, str(v)) for k, v in tags.items())))
+    with _lock:
+        counts = _histograms.get(key)
+        if counts is None:
+            counts = _histograms[key] = [0] * (len(BUCKETS) + 2)
+        for i, upper in enumerate(BUCKETS):
+            if seconds <= upper:
+                counts[i] += 1
+                break
+        counts[-2] += seconds
+        counts[-1] += 1
+    if METRICS_PATH.endswith('.prom'):
+        _maybe_write_prometheus()
+    else:
+        _append_json_line({'ts': time.time(), 'span': name, 'seconds': seconds, **dict(key[1])})
+
+
+def _append_json_line(payload):
+    line = json.dumps(payload) + '\n'
+    with _lock:
+        with open(METRICS_PATH, 'a') as f:
+            f.write(line)
+
+
+def prometheus_text():
+    """The histograms in the Prometheus text exposition format"""
+    lines = [
+        f'# HELP {METRIC_NAME} Time spent in timed blocks of the app',
+        f'# TYPE {METRIC_NAME} histogram',
+    ]
+    with _lock:
+        histograms = {key: list(counts) for key, counts in _histograms.items()}
+    for (name, tags), counts in sorted(histograms.items()):
+        labels = ','.join(f'{k}="{_escape(v)}"' for k, v in (('span', name),) + tags)
+        cumulative = 0
+        for upper, count in zip(BUCKETS, counts):
+            cumulative += count
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{upper:g}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {counts[-1]}')
+        lines.append(f'{METRIC_NAME}_sum{{{labels}}} {counts[-2]:.6f}')
+        lines.append(f'{METRIC_NAME}_count{{{labels}}} {counts[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def write_prometheus(path=None):
+    """Write the histograms to path (the configured file by default)"""
+    global _last_write
+    path = path or METRICS_PATH
+    with _write_lock:
+        _last_write = time.monotonic()
+        # Written aside and renamed, so a scrape never reads half a file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, path)
+
+
+def _maybe_write_prometheus():
+    if time.monotonic() - _last_write >= METRICS_INTERVAL and not _write_lock.locked():
+        write_prometheus()
+
+
+if METRICS_PATH.endswith('.prom'):
+    # The last few seconds of spans would otherwise never be written
+    atexit.register(lambda: _histograms and write_prometheus())
+
+
+def summarize(path):
+    """Count and p50/p90/p99 in milliseconds per span and tags, from a JSON-lines span log"""
+    import pandas as pd
+
+    spans = pd.read_json(path, lines=True)
+    groups = [c for c in spans.columns if c not in ('ts', 'seconds')]
+    milliseconds = (spans['seconds'] * 1000).groupby([spans[c] for c in groups], dropna=False)
+    return pd.DataFrame({
+        'count': milliseconds.size(),
+        'p50_ms': milliseconds.quantile(0.5),
+        'p90_ms': milliseconds.quantile(0.9),
+        'p99_ms': milliseconds.quantile(0.99),
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency percentiles from a span log")
+    parser.add_argument("log", help="JSON-lines file written with WEIGHT_TRACKER_METRICS")
+    args = parser.parse_args()
+    print(summarize(args.log).round(2).to_string())
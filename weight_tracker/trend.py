@@ -0,0 +1,180 @@
+"""Weight trend (kg per week) fitted over a time window.
+
+The rate is the slope of weight against time over the entries of the last
+``TREND_WINDOW_DAYS`` days before the latest entry, so daily, weekly and
+irregular loggers all get a rate over the same span of time. Least squares
+is the default; Theil-Sen (the median of pairwise slopes over daily
+medians) ignores the odd bad reading at a higher cost.
+
+``TrendWindow`` keeps the least-squares sums (n, Σt, Σw, Σt², Σtw) for the
+current window, updated as entries are appended and leave the window, so
+the slope is O(1) to read; ``storage`` maintains one per user. NumPy only.
+"""
+import os
+
+import numpy as np
+
+# Days of history, back from the latest entry, that the trend is fitted over
+TREND_WINDOW_DAYS = float(os.environ.get('WEIGHT_TRACKER_TREND_DAYS', '28'))
+
+# 'least_squares' or 'theil_sen'
+TREND_METHOD = os.environ.get('WEIGHT_TRACKER_TREND_METHOD', 'least_squares')
+
+# Theil-Sen over more daily points than this uses a fixed random sample of pairs
+THEIL_SEN_MAX_POINTS = 1000
+THEIL_SEN_SAMPLE_PAIRS = 200_000
+
+_DAY = np.timedelta64(1, 'D')
+
+
+def _dates(values):
+    return np.asarray(values).astype('datetime64[ns]')
+
+
+def _window(days):
+    return np.timedelta64(int(days * 86400), 's')
+
+
+def _sums(t, w):
+    return np.array([len(t), t.sum(), w.sum(), (t * t).sum(), (t * w).sum()])
+
+
+def _slope_from_sums(sums):
+    n, st, sw, stt, stw = sums
+    denom = n * stt - st * st
+    # All entries at (almost) the same moment: no slope to speak of
+    if n < 2 or denom <= 1e-9 * max(n * stt, 1.0):
+        return 0.0
+    return float((n * stw - st * sw) / denom)
+
+
+def least_squares_slope(dates, weights):
+    """Least-squares slope of weights over dates, in kg per day"""
+    dates = _dates(dates)
+    if len(dates) < 2:
+        return 0.0
+    t = (dates - dates[0]) / _DAY
+    return _slope_from_sums(_sums(t - t.mean(), np.asarray(weights, dtype=float)))
+
+
+def daily_medians(dates, weights):
+    """(distinct days, median weight of each day) for entries in any order"""
+    days = _dates(dates).astype('datetime64[D]')
+    weights = np.asarray(weights, dtype=float)
+    order = np.lexsort((weights, days))
+    days, weights = days[order], weights[order]
+    starts = np.flatnonzero(np.concatenate(([True], days[1:] != days[:-1])))
+    counts = np.diff(np.append(starts, len(days)))
+    medians = (weights[starts + (counts - 1) // 2] + weights[starts + counts // 2]) / 2
+    return days[starts], medians
+
+
+def theil_sen_slope(dates, weights):
+    """Theil-Sen slope of daily median weights over dates, in kg per day"""
+    days, medians = daily_medians(dates, weights)
+    m = len(days)
+    if m < 2:
+        return 0.0
+    t = (days - days[0]) / _DAY
+    if m <= THEIL_SEN_MAX_POINTS:
+        i, j = np.triu_indices(m, 1)
+    else:
+        # Seeded so the same history always gets the same estimate
+        rng = np.random.default_rng(0)
+        i, j = rng.integers(0, m, (2, THEIL_SEN_SAMPLE_PAIRS))
+        i, j = np.minimum(i, j), np.maximum(i, j)
+        i, j = i[i != j], j[i != j]
+    return float(np.median((medians[j] - medians[i]) / (t[j] - t[i])))
+
+
+def weekly_rate(dates, weights, window_days=TREND_WINDOW_DAYS, method=None):
+    """Trend in kg/week over the last window_days of a date-sorted history.
+
+    window_days=None fits the whole history given.
+    """
+    dates = _dates(dates)
+    weights = np.asarray(weights, dtype=float)
+    if window_days is not None and len(dates):
+        start = np.searchsorted(dates, dates[-1] - _window(window_days), side='right')
+        dates, weights = dates[start:], weights[start:]
+    if (method or TREND_METHOD) == 'theil_sen':
+        return theil_sen_slope(dates, weights) * 7
+    return least_squares_slope(dates, weights) * 7
+
+
+class TrendWindow:
+    """Entries within window_days of the latest entry, with least-squares sums.
+
+    Times are days since an anchor inside the window (re-anchored as the
+    window moves on, which keeps the sums small and exact enough). Instances
+    are not modified; extend() returns a new window.
+    """
+
+    def __init__(self, dates=None, weights=None, window_days=None):
+        self.window_days = window_days or TREND_WINDOW_DAYS
+        dates = np.array([], dtype='datetime64[ns]') if dates is None else _dates(dates)
+        weights = np.array([]) if weights is None else np.asarray(weights, dtype=float)
+        if len(dates):
+            order = np.argsort(dates, kind='stable')
+            dates, weights = dates[order], weights[order]
+            keep = dates > dates[-1] - _window(self.window_days)
+            dates, weights = dates[keep], weights[keep]
+        self.dates = dates
+        self.weights = weights
+        self.anchor = dates[0] if len(dates) else None
+        self.sums = _sums(self._t(dates), weights)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Window at the end of a history frame with date and weight columns"""
+        dates = _dates(df['date'])
+        if len(dates) and (dates[1:] >= dates[:-1]).all():
+            # Date-sorted (as stored): only the tail can be in the window
+            start = np.searchsorted(dates, dates[-1] - _window(TREND_WINDOW_DAYS), side='right')
+            return cls(dates[start:], df['weight'].to_numpy()[start:])
+        return cls(dates, df['weight'].to_numpy())
+
+    def _t(self, dates):
+        if self.anchor is None:
+            return np.zeros(len(dates))
+        return (dates - self.anchor) / _DAY
+
+    def extend(self, dates, weights, notes=None):
+        """Window with a batch of entries added (in any order; notes are ignored)"""
+        dates = _dates(dates)
+        weights = np.asarray(weights, dtype=float)
+        if len(dates) == 0:
+            return self
+        in_order = (dates[1:] >= dates[:-1]).all() and (not len(self.dates) or dates[0] >= self.dates[-1])
+        start = dates[-1] - _window(self.window_days) if in_order else None
+        if not in_order or self.anchor is None or self.anchor <= start - _window(10 * self.window_days):
+            # Inserted before the end, or time to re-anchor: rebuild from the entries
+            return TrendWindow(np.concatenate((self.dates, dates)), np.concatenate((self.weights, weights)), self.window_days)
+
+        # Appended: add the new entries' terms, subtract those of entries leaving
+        keep = dates > start
+        dates, weights = dates[keep], weights[keep]
+        leaving = np.searchsorted(self.dates, start, side='right')
+        window = TrendWindow.__new__(TrendWindow)
+        window.window_days = self.window_days
+        window.anchor = self.anchor
+        window.dates = np.concatenate((self.dates[leaving:], dates))
+        window.weights = np.concatenate((self.weights[leaving:], weights))
+        window.sums = (
+            self.sums + _sums(self._t(dates), weights)
+            - _sums(self._t(self.dates[:leaving]), self.weights[:leaving])
+        )
+        return window
+
+    def weekly_rate(self, method=None):
+        """Trend over the window in kg/week"""
+        if (method or TREND_METHOD) == 'theil_sen':
+            return theil_sen_slope(self.dates, self.weights) * 7
+        return _slope_from_sums(self.sums) * 7
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def nbytes(self):
+        return int(self.dates.nbytes + self.weights.nbytes) + 128
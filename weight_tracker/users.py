@@ -0,0 +1,212 @@
+"""User accounts: a log-structured file store plus a process-wide registry.
+
+``users.json`` is a snapshot; every sign-up or password change appends one
+JSON line to ``users.log`` instead of rewriting the snapshot, so account
+writes cost the same no matter how many users exist. Once the log holds
+``WEIGHT_TRACKER_USERS_COMPACT_AFTER`` records it is folded back into a
+fresh snapshot. Log records are whole-account upserts, so replaying one
+twice is harmless, which keeps readers correct while a compaction is in
+progress.
+
+The login, sign-up and password-reset forms look accounts up on nearly
+every rerun. The registry parses the files once, then only reads log bytes
+appended since its last look (or reloads if the snapshot changed).
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from weight_tracker import sqlite_store, storage
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+USERS_FILE = Path("users.json")
+USERS_LOG = Path("users.log")
+LOCK_FILE = Path("users.lock")
+
+# Fold the change log into users.json after this many records
+COMPACT_AFTER = int(os.environ.get('WEIGHT_TRACKER_USERS_COMPACT_AFTER', '1000'))
+
+_thread_lock = threading.RLock()
+
+
+@contextmanager
+def _store_lock():
+    """Serialize account writes across threads and, where supported, processes"""
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(LOCK_FILE, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_snapshot(path):
+    if path.exists():
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except:
+            pass
+    return {}
+
+
+def _apply_log(data, users):
+    """Apply complete log lines from data (bytes); returns (bytes consumed, records applied)"""
+    end = data.rfind(b'\n') + 1  # A trailing partial line is still being written
+    records = 0
+    for line in data[:end].splitlines():
+        if line.strip():
+            record = json.loads(line)
+            users[record['username']] = record['account']
+            records += 1
+    return end, records
+
+
+def read_account_files(data_dir='.'):
+    """Return accounts from users.json plus any records not yet compacted from users.log"""
+    data_dir = Path(data_dir)
+    users = _read_snapshot(data_dir / USERS_FILE.name)
+    log_path = data_dir / USERS_LOG.name
+    if log_path.exists():
+        _apply_log(log_path.read_bytes(), users)
+    return users
+
+
+def _write_snapshot(users):
+    """Atomically replace users.json and empty the log it now includes"""
+    tmp_path = USERS_FILE.with_suffix('.json.tmp')
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(users, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, USERS_FILE)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    with open(USERS_LOG, 'w'):
+        pass
+
+
+def load_users():
+    """Load every account, or an empty dict if no users exist"""
+    if storage.STORAGE_BACKEND == 'sqlite':
+        return sqlite_store.load_users()
+    return read_account_files()
+
+
+def save_users(users):
+    """Replace the whole account set (bulk imports and compaction)"""
+    if storage.STORAGE_BACKEND == 'sqlite':
+        sqlite_store.save_users(users)
+        return
+    with _store_lock():
+        _write_snapshot(users)
+    _registry.reset()
+
+
+class UserRegistry:
+    """Cached view of the snapshot plus change log, with O(1) appends"""
+
+    def __init__(self):
+        self._users = {}
+        self._snapshot_version = None
+        self._log_offset = 0
+        self._log_records = 0
+        self._lock = threading.RLock()
+
+    def reset(self):
+        with self._lock:
+            self._snapshot_version = None
+
+    def _refresh(self):
+        snapshot_version = storage.file_version(USERS_FILE)
+        log_version = storage.file_version(USERS_LOG)
+        log_size = log_version[1] if log_version else 0
+        if snapshot_version != self._snapshot_version or log_size < self._log_offset:
+            # New snapshot (compaction or external write): start over
+            self._users = _read_snapshot(USERS_FILE)
+            self._snapshot_version = snapshot_version
+            self._log_offset = 0
+            self._log_records = 0
+        if log_size > self._log_offset:
+            with open(USERS_LOG, 'rb') as f:
+                f.seek(self._log_offset)
+                consumed, records = _apply_log(f.read(), self._users)
+            self._log_offset += consumed
+            self._log_records += records
+
+    def get(self, username):
+        """Return a copy of an account record, or None"""
+        with self._lock:
+            self._refresh()
+            user = self._users.get(username)
+        return dict(user) if user is not None else None
+
+    def put(self, username, record, only_if_new=False):
+        """Create or replace an account; returns False if only_if_new and it exists"""
+        with self._lock, _store_lock():
+            self._refresh()
+            if only_if_new and username in self._users:
+                return False
+            line = (json.dumps({'username': username, 'account': record}) + '\n').encode()
+            with open(USERS_LOG, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._users[username] = dict(record)
+            self._log_offset += len(line)
+            self._log_records += 1
+            if self._log_records >= COMPACT_AFTER:
+                _write_snapshot(self._users)
+                self._snapshot_version = storage.file_version(USERS_FILE)
+                self._log_offset = 0
+                self._log_records = 0
+        return True
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._users)
+
+
+_registry = UserRegistry()
+
+
+def get_user(username):
+    """Look up an account record ({'password', 'security_question', 'security_answer'})"""
+    if storage.STORAGE_BACKEND == 'sqlite':
+        return sqlite_store.get_user(username)
+    return _registry.get(username)
+
+
+def add_user(username, record):
+    """Create an account atomically; returns False if the username is taken"""
+    if storage.STORAGE_BACKEND == 'sqlite':
+        return sqlite_store.add_user(username, record)
+    return _registry.put(username, record, only_if_new=True)
+
+
+def put_user(username, record):
+    """Create or update an account record"""
+    if storage.STORAGE_BACKEND == 'sqlite':
+        sqlite_store.save_users({username: record})
+        return
+    _registry.put(username, record)
+
+
+def has_users():
+    """True once at least one account exists"""
+    if storage.STORAGE_BACKEND == 'sqlite':
+        return sqlite_store.has_users()
+    return len(_registry) > 0
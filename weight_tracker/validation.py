@@ -0,0 +1,98 @@
+"""Vectorized validation rules for weight entries.
+
+The same limits the Add Weight form enforces one entry at a time, applied
+to whole arrays at once so bulk imports get checked too. Rules come in two
+groups: value checks that look at each row on its own, and sequence checks
+that need rows in date order (duplicates, jumps from the previous entry).
+"""
+import numpy as np
+import pandas as pd
+
+# Bounds of the Add Weight form's number_input
+MIN_WEIGHT_KG = 30.0
+MAX_WEIGHT_KG = 300.0
+# Change from the previous entry that is flagged as suspicious
+MAX_JUMP_KG = 5.0
+
+ISSUES = {
+    'bad_date': "Unparseable date",
+    'bad_weight': "Unparseable weight",
+    'out_of_range': f"Weight outside {MIN_WEIGHT_KG:g}-{MAX_WEIGHT_KG:g} kg",
+    'future_date': "Date is in the future",
+    'duplicate_date': "An entry for this date already exists",
+    'large_jump': f"Weight changed more than {MAX_JUMP_KG:g} kg from the previous entry",
+}
+
+# Issues that keep a row out of the history; the rest are warnings
+REJECTING_ISSUES = {'bad_date', 'bad_weight', 'out_of_range', 'future_date', 'duplicate_date'}
+
+
+def parse_dates(values):
+    """Parse a column of date strings, leaving NaT where a value isn't a date.
+
+    ISO 8601 (any mix of date-only and timestamped) takes the fast path;
+    only values that fail it are parsed element by element.
+    """
+    dates = pd.to_datetime(values, format='ISO8601', errors='coerce')
+    retry = dates.isna() & values.notna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(values[retry], format='mixed', errors='coerce')
+    return dates
+
+
+def check_values(raw_dates, raw_weights, today=None):
+    """Parse and check rows independently of each other.
+
+    Returns (dates, weights, issues), where issues maps an ISSUES key to a
+    boolean mask over the rows.
+    """
+    dates = parse_dates(pd.Series(raw_dates))
+    weights = pd.to_numeric(pd.Series(raw_weights), errors='coerce')
+    tomorrow = (pd.Timestamp(today) if today is not None else pd.Timestamp.now()).normalize() + pd.Timedelta(days=1)
+
+    issues = {
+        'bad_date': dates.isna().to_numpy(),
+        'bad_weight': weights.isna().to_numpy(),
+        'out_of_range': ((weights < MIN_WEIGHT_KG) | (weights > MAX_WEIGHT_KG)).to_numpy(),
+        'future_date': (dates >= tomorrow).to_numpy(),
+    }
+    return dates, weights, issues
+
+
+def check_sequence(dates, weights, previous=None):
+    """Duplicate and jump checks over rows already sorted by date.
+
+    previous is the (date, weight) of the entry just before these rows, if
+    any. A row repeating an earlier date is a duplicate and is skipped when
+    measuring jumps, so each jump is measured from the last row that stays.
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    weights = np.asarray(weights, dtype=float)
+    prior_dates = np.empty_like(dates)
+    prior_dates[1:] = dates[:-1]
+    prior_dates[:1] = np.datetime64(previous[0], 'ns') if previous else np.datetime64('NaT')
+    duplicate = dates == prior_dates
+
+    # Forward-fill the weight of the last kept row to compare each row against
+    kept_weights = np.where(duplicate, np.nan, weights)
+    reference = pd.Series(np.concatenate(([previous[1] if previous else np.nan], kept_weights[:-1]))).ffill().to_numpy()
+    with np.errstate(invalid='ignore'):
+        jump = ~duplicate & (np.abs(weights - reference) > MAX_JUMP_KG)
+    return {'duplicate_date': duplicate, 'large_jump': jump}
+
+
+def flagged_rows(rows, issues):
+    """(row, issue) pairs for every row flagged in the issue masks"""
+    rows = np.asarray(rows, dtype=np.int64)
+    return pd.DataFrame({
+        'row': np.concatenate([rows[mask] for mask in issues.values()] + [rows[:0]]),
+        'issue': np.concatenate([np.repeat(name, mask.sum()) for name, mask in issues.items()] + [np.array([], dtype=object)]),
+    })
+
+
+def build_report(parts):
+    """Combine flagged_rows() frames into a per-row report with messages"""
+    parts = list(parts) or [flagged_rows([], {})]
+    report = pd.concat(parts, ignore_index=True).sort_values(['row', 'issue'], kind='stable', ignore_index=True)
+    report['message'] = report['issue'].map(ISSUES)
+    return report